@@ -5,7 +5,9 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
 import os
+import time
 import threading
+from contextlib import contextmanager
 from sqlalchemy import inspect
 from sqlalchemy import create_engine
 
@@ -26,6 +28,55 @@ limiter = Limiter(
 
 _initialized = False
 
+def add_missing_columns(engine, Base, inspector, existing_tables):
+    """
+    Add columns that were introduced after a table was first created.
+    New columns are nullable or carry a scalar default, so a plain
+    ALTER TABLE ... ADD COLUMN is enough on both SQLite and PostgreSQL.
+    """
+    from sqlalchemy import text, literal
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+            if column.default is not None and column.default.is_scalar:
+                default = literal(column.default.arg).compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+                ddl += f" DEFAULT {default}"
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(ddl))
+                logger.info(f"🧱 Added column {table.name}.{column.name}")
+            except Exception as e:
+                # Another worker may have added it first
+                if "duplicate" not in str(e).lower() and "already exists" not in str(e).lower():
+                    raise
+
+def add_missing_indexes(engine, Base, inspector, existing_tables):
+    """
+    Create indexes declared on tables that already existed, e.g. for
+    columns add_missing_columns just added; CREATE TABLE only covers new
+    tables.
+    """
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in present:
+                continue
+            try:
+                index.create(engine, checkfirst=True)
+                logger.info(f"🧱 Added index {index.name} on {table.name}")
+            except Exception as e:
+                # Another worker may have created it first
+                if "duplicate" not in str(e).lower() and "already exists" not in str(e).lower():
+                    raise
+
 def safe_init_db(engine, Base):
     from sqlalchemy.exc import OperationalError
     inspector = inspect(engine)
@@ -36,6 +87,9 @@ def safe_init_db(engine, Base):
 
     missing = [t.name for t in Base.metadata.sorted_tables if t.name not in existing_tables]
 
+    add_missing_columns(engine, Base, inspector, existing_tables)
+    add_missing_indexes(engine, Base, inspector, existing_tables)
+
     if not missing:
         logger.info("✅ All tables already exist — skipping creation.")
         return
@@ -67,35 +121,108 @@ def safe_init_db(engine, Base):
             raise
 
 def init_default_keys():
+    """Sync key.txt into api_keys with a single set-based insert."""
     from app.models import get_session, APIKey
-    db = get_session()
 
     if not os.path.exists('key.txt'):
         logger.info("🔑 key.txt not found — skipping default keys initialization.")
-        db.close()
         return
 
     with open('key.txt', 'r') as f:
-        keys = [line.strip() for line in f if line.strip()]
+        keys = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+    if not keys:
+        return
 
-    for key in keys:
-        exists = db.query(APIKey).filter_by(key=key).first()
-        if not exists:
-            try:
-                db.add(APIKey(key=key))
-                db.commit()
-                logger.info(f"✅ Added API key: {key}")
-            except Exception:
-                db.rollback()
-                logger.warning(f"⚠️ Skipped duplicate key {key}: (UNIQUE constraint failed)")
+    db = get_session()
+    try:
+        dialect = db.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(APIKey).values([{"key": k} for k in keys]).on_conflict_do_nothing(index_elements=['key'])
+            added = db.execute(stmt).rowcount
+        else:
+            existing = {k for (k,) in db.query(APIKey.key).filter(APIKey.key.in_(keys))}
+            missing = [k for k in keys if k not in existing]
+            db.add_all([APIKey(key=k) for k in missing])
+            added = len(missing)
+        db.commit()
+        logger.info(f"🔑 Synced key.txt: {added} added, {len(keys) - added} already present")
+    except Exception:
+        db.rollback()
+        logger.exception("⚠️ Failed to sync default API keys")
+    finally:
+        db.close()
+
+
+@contextmanager
+def _startup_phase(name: str, timings: dict):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+
+
+def _start_telegram(run_as_leader):
+    # Importing python-telegram-bot alone costs a few hundred ms, so under
+    # fast start this whole function runs off the boot path
+    try:
+        from app.handlers.telegram_handler import (
+            setup_telegram_bot, start_telegram_polling, get_telegram_mode,
+            start_telegram_webhook, register_telegram_webhook
+        )
+        bot_app = setup_telegram_bot()
+    except Exception:
+        logger.exception("❌ Failed to initialize Telegram bot")
+        return
+
+    if get_telegram_mode() == 'webhook':
+        # Every worker processes updates; only the leader registers the hook
+        if start_telegram_webhook(bot_app):
+            def _register_webhook():
+                hook_res = register_telegram_webhook(bot_app)
+                if hook_res.get("ok"):
+                    logger.info(f"🤖 Telegram webhook mode active: {hook_res.get('details')}")
+                    # Hold the role so no other worker re-registers; a failure
+                    # returns instead, releasing it for another attempt
+                    threading.Event().wait()
+                else:
+                    logger.warning(f"⚠️ Telegram webhook registration failed: {hook_res.get('details')}")
+            run_as_leader('telegram-webhook', _register_webhook)
+    else:
+        run_as_leader('telegram-polling', lambda: start_telegram_polling(bot_app))
+        logger.info("🤖 Telegram polling queued for leader election")
+
+
+def _facebook_boot_check():
+    from app.handlers.facebook_handler import facebook_startup_check, subscribe_page_if_configured
+
+    fb_status = facebook_startup_check()
+    if fb_status.get("ok"):
+        logger.info(f"📡 Facebook token valid: {fb_status.get('details')}")
+        sub_res = subscribe_page_if_configured()
+        if sub_res.get("ok"):
+            logger.info("📡 Facebook page subscription succeeded")
         else:
-            logger.info(f"🔹 Key already exists: {key}")
+            logger.debug(f"📡 Facebook subscribe attempt result: {sub_res.get('details')}")
+    else:
+        logger.warning(f"⚠️ Facebook startup check failed: {fb_status.get('details')}")
+
+
+def fast_start_enabled() -> bool:
+    return os.getenv('FAST_START', '1').lower() not in ('0', 'false', 'no')
 
-    db.close()
 
 def create_app():
     global _initialized
 
+    timings = {}
+    boot_start = time.perf_counter()
+    fast_start = fast_start_enabled()
+
     app = Flask(__name__)
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///alertbot.db')
@@ -104,74 +231,64 @@ def create_app():
     limiter.init_app(app)
 
     from app.models import Base
-    from app.models import get_engine
+    from app.models import get_engine, SessionLocal
+    from app.utils import run_as_leader, load_env_encrypted
 
     engine = get_engine(app.config['SQLALCHEMY_DATABASE_URI'])
 
+    @app.teardown_appcontext
+    def remove_session(exc=None):
+        # Roll back anything the request left uncommitted and return its connection to the pool
+        SessionLocal.remove()
+
     if not _initialized:
         try:
-            safe_init_db(engine, Base)
-            init_default_keys()
+            with _startup_phase('init_db', timings):
+                safe_init_db(engine, Base)
+            with _startup_phase('default_keys', timings):
+                init_default_keys()
 
-            from app.queue import start_scheduler
-            start_scheduler()
-            logger.info("📦 Retry queue scheduler started")
+            from app.queue import run_scheduler
+            run_as_leader('retry-scheduler', run_scheduler)
+            logger.info("📦 Retry queue scheduler queued for leader election")
         finally:
             _initialized = True
 
-    from app.routes import register_routes
-    register_routes(app)
+    with _startup_phase('routes', timings):
+        from app.routes import register_routes
+        from app.tracing import init_tracing
+        register_routes(app)
+        init_tracing(app)
 
-    try:
-        from app.handlers.telegram_handler import setup_telegram_bot, start_telegram_polling
-    except Exception:
-        setup_telegram_bot = None
-        start_telegram_polling = None
+    with _startup_phase('telegram', timings):
+        try:
+            if load_env_encrypted('TELEGRAM_BOT_TOKEN', ''):
+                if fast_start:
+                    threading.Thread(target=_start_telegram, args=(run_as_leader,), daemon=True).start()
+                else:
+                    _start_telegram(run_as_leader)
+            else:
+                logger.info("⚠️ TELEGRAM_BOT_TOKEN not set; Telegram bot not started")
+        except Exception:
+            logger.exception("❌ Failed to initialize Telegram bot")
 
-    try:
-        from app.handlers.facebook_handler import facebook_startup_check, subscribe_page_if_configured, start_facebook_monitor
-    except Exception:
-        facebook_startup_check = None
-        subscribe_page_if_configured = None
-        start_facebook_monitor = None
+    with _startup_phase('facebook', timings):
+        try:
+            from app.handlers.facebook_handler import run_facebook_monitor
 
-    try:
-        if setup_telegram_bot and start_telegram_polling:
-            bot_app = setup_telegram_bot()
-            if bot_app:
-                t = threading.Thread(target=start_telegram_polling, args=(bot_app,), daemon=True)
-                t.start()
-                logger.info("🤖 Telegram polling started in background thread")
-            else:
-                logger.info("⚠️ TELEGRAM_BOT_TOKEN not set; Telegram polling not started")
-        else:
-            logger.debug("🤖 Telegram starter not available; skipping Telegram startup")
-    except Exception:
-        logger.exception("❌ Failed to initialize Telegram polling")
+            # The monitor validates the token and subscribes the page on its
+            # first pass, so fast start skips the blocking check here.
+            if not fast_start:
+                _facebook_boot_check()
 
-    try:
-        if facebook_startup_check:
-            fb_status = facebook_startup_check()
-            if fb_status.get("ok"):
-                logger.info(f"📡 Facebook token valid: {fb_status.get('details')}")
-                if subscribe_page_if_configured:
-                    sub_res = subscribe_page_if_configured()
-                    if sub_res.get("ok"):
-                        logger.info("📡 Facebook page subscription succeeded")
-                    else:
-                        logger.debug(f"📡 Facebook subscribe attempt result: {sub_res.get('details')}")
-            else:
-                logger.warning(f"⚠️ Facebook startup check failed: {fb_status.get('details')}")
+            interval = int(os.getenv("FACEBOOK_MONITOR_INTERVAL", "600"))
+            run_as_leader('facebook-monitor', lambda: run_facebook_monitor(interval_seconds=interval))
+            logger.info("📡 Facebook monitor queued for leader election")
+        except Exception:
+            logger.exception("❌ Exception during Facebook startup")
 
-            if start_facebook_monitor:
-                try:
-                    start_facebook_monitor(interval_seconds=int(os.getenv("FACEBOOK_MONITOR_INTERVAL", "600")))
-                    logger.info("📡 Facebook monitor started")
-                except Exception:
-                    logger.exception("❌ Failed to start Facebook monitor")
-        else:
-            logger.debug("📡 Facebook startup helpers not available; skipping FB startup checks")
-    except Exception:
-        logger.exception("❌ Exception during Facebook startup")
+    total_ms = (time.perf_counter() - boot_start) * 1000
+    phases = ", ".join(f"{name}={ms:.0f}ms" for name, ms in timings.items())
+    logger.info(f"🚀 App ready in {total_ms:.0f}ms (fast_start={fast_start}; {phases})")
 
     return app
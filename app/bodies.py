@@ -0,0 +1,132 @@
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import select
+
+from app.models import engine, MessageBody
+from app.utils.config import config_section
+
+def _config() -> Dict:
+    return config_section('message_bodies')
+
+
+class BodyCache:
+    """Thread-safe LRU of decoded message bodies keyed by content hash."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, body_hash: str) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(body_hash)
+            if text is not None:
+                self._entries.move_to_end(body_hash)
+            return text
+
+    def put(self, body_hash: str, text: str):
+        with self._lock:
+            self._entries[body_hash] = text
+            self._entries.move_to_end(body_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache: Optional[BodyCache] = None
+_cache_lock = threading.Lock()
+
+
+def _body_cache() -> BodyCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = BodyCache(_config().get('cache_size', 1024))
+        return _cache
+
+
+def hash_body(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _encode(text: str):
+    data = text.encode('utf-8')
+    if len(data) >= _config().get('compress_min_bytes', 256):
+        compressed = zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return compressed, True, len(data)
+    return data, False, len(data)
+
+
+def _decode(data: bytes, compressed: bool) -> str:
+    return (zlib.decompress(data) if compressed else data).decode('utf-8')
+
+
+def store_body(db, text: str) -> str:
+    """
+    Make sure `text` exists in message_bodies inside the caller's transaction
+    and return its hash. Repeated bodies cost an INSERT that hits the
+    conflict clause and writes nothing.
+    """
+    body_hash = hash_body(text)
+    data, compressed, size = _encode(text)
+    values = {"hash": body_hash, "body": data, "compressed": compressed, "size": size}
+    dialect = db.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        db.execute(insert(MessageBody).values(**values).on_conflict_do_nothing(index_elements=['hash']))
+    elif db.get(MessageBody, body_hash) is None:
+        db.add(MessageBody(**values))
+
+    _body_cache().put(body_hash, text)
+    return body_hash
+
+
+def body_fields(db, text: str) -> Dict[str, str]:
+    """Column values for a MessageLog/RetryQueue row whose body lives in message_bodies."""
+    return {"message": '', "body_hash": store_body(db, text)}
+
+
+def prefetch_bodies(hashes: Iterable[str]) -> Dict[str, str]:
+    """
+    Load any uncached bodies among `hashes` with a single query. Returns the
+    bodies found, keyed by hash, so a caller can use a whole batch even when
+    it holds more distinct bodies than the cache keeps.
+    """
+    cache = _body_cache()
+    found = {}
+    missing = set()
+    for h in hashes:
+        if not h or h in found:
+            continue
+        text = cache.get(h)
+        if text is None:
+            missing.add(h)
+        else:
+            found[h] = text
+    if not missing:
+        return found
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(MessageBody.hash, MessageBody.body, MessageBody.compressed)
+            .where(MessageBody.hash.in_(missing))
+        )
+        for body_hash, data, compressed in rows:
+            found[body_hash] = _decode(data, compressed)
+            cache.put(body_hash, found[body_hash])
+    return found
+
+
+def load_body(body_hash: str) -> Optional[str]:
+    cache = _body_cache()
+    text = cache.get(body_hash)
+    if text is None:
+        prefetch_bodies([body_hash])
+        text = cache.get(body_hash)
+    return text
@@ -0,0 +1,266 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app import handlers
+from app.handlers import errors
+from app.tracing import span
+from app.utils.config import config_section
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_CHANNEL_SENDERS = {
+    'email': 'send_email',
+    'telegram': 'send_telegram',
+    'facebook': 'send_facebook',
+}
+
+CHANNELS = tuple(_CHANNEL_SENDERS)
+# Channels whose handler accepts a list of recipients and returns per-recipient results
+BATCH_CHANNELS = ('email',)
+
+
+class CircuitBreaker:
+    """
+    Per-channel circuit breaker. After `failure_threshold` consecutive
+    failures the breaker opens and calls fail fast for `recovery_timeout`
+    seconds; it then lets up to `half_open_max_calls` probe requests through.
+    A successful probe closes it again, a failed one re-opens it.
+    """
+
+    def __init__(self, channel: str, failure_threshold: int = 5,
+                 recovery_timeout: float = 30, half_open_max_calls: int = 1):
+        self.channel = channel
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.total_rejected = 0
+        self._lock = threading.Lock()
+
+    def _maybe_half_open(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = HALF_OPEN
+            self.half_open_calls = 0
+            logger.info("Circuit for %s half-open; sending probe", self.channel)
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected without reaching the provider."""
+        with self._lock:
+            self._maybe_half_open()
+            if self.state == OPEN:
+                return True
+            return self.state == HALF_OPEN and self.half_open_calls >= self.half_open_max_calls
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            self._maybe_half_open()
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self.half_open_calls < self.half_open_max_calls:
+                self.half_open_calls += 1
+                return True
+            self.total_rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Circuit for %s closed", self.channel)
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning("Circuit for %s opened after %s failures", self.channel, self.failures)
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open()
+            retry_in = 0
+            if self.state == OPEN:
+                retry_in = max(0, int(self.recovery_timeout - (time.monotonic() - self.opened_at)))
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "failure_threshold": self.failure_threshold,
+                "rejected": self.total_rejected,
+                "retry_in": retry_in,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(channel: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(channel)
+        if breaker is None:
+            settings = config_section('circuit_breaker')
+            breaker = CircuitBreaker(
+                channel,
+                failure_threshold=settings.get('failure_threshold', 5),
+                recovery_timeout=settings.get('recovery_timeout', 30),
+                half_open_max_calls=settings.get('half_open_max_calls', 1),
+            )
+            _breakers[channel] = breaker
+        return breaker
+
+
+class BadRecipientCache:
+    """
+    Bounded, TTL'd record of recipients that failed permanently (unknown
+    address, bot blocked, ...). Sends to them fail fast without touching the
+    provider until the entry expires.
+    """
+
+    def __init__(self, ttl: float = 86400, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, channel: str, recipient: str) -> Optional[Dict[str, Any]]:
+        key = (channel, recipient)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            return result
+
+    def add(self, channel: str, recipient: str, result: Dict[str, Any]):
+        key = (channel, recipient)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, channel: str, recipient: str):
+        with self._lock:
+            self._entries.pop((channel, recipient), None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_bad_recipients: Optional[BadRecipientCache] = None
+
+
+def get_bad_recipients() -> BadRecipientCache:
+    global _bad_recipients
+    with _breakers_lock:
+        if _bad_recipients is None:
+            settings = config_section('bad_recipients')
+            _bad_recipients = BadRecipientCache(
+                ttl=settings.get('ttl', 86400),
+                max_entries=settings.get('max_entries', 10000),
+            )
+        return _bad_recipients
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    return {channel: get_breaker(channel).snapshot() for channel in CHANNELS}
+
+
+def guarded_send(channel: str, recipient: str, message: str) -> Dict[str, Any]:
+    """
+    Send through the channel handler behind its circuit breaker. When the
+    breaker is open the provider is not contacted and the result carries
+    circuit_open=True so callers can queue the message for later. Recipients
+    known to be permanently unreachable fail fast with retryable=False.
+    """
+    sender = getattr(handlers, _CHANNEL_SENDERS[channel])
+    breaker = get_breaker(channel)
+    bad_recipients = get_bad_recipients()
+
+    known_bad = bad_recipients.get(channel, recipient)
+    if known_bad is not None:
+        return dict(known_bad, details=f"recipient previously failed permanently: {known_bad['details']}")
+
+    if not breaker.allow_request():
+        return {"status": "failed", "details": f"{channel} circuit open; provider calls suspended",
+                "error_class": errors.PROVIDER, "retryable": True, "circuit_open": True}
+
+    try:
+        with span(f'provider:{channel}'):
+            result = sender(recipient, message)
+    except Exception:
+        breaker.record_failure()
+        raise
+
+    # Only transient failures say anything about the provider's health
+    if result['status'] == 'sent' or not errors.is_retryable(result):
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+    if result.get('error_class') in errors.RECIPIENT_ERRORS:
+        bad_recipients.add(channel, recipient, result)
+    return result
+
+
+def guarded_send_many(channel: str, recipients: List[str], message: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Batch form of guarded_send for BATCH_CHANNELS: one provider call (and one
+    breaker probe) for every recipient not already known to be bad.
+    Returns a result per recipient.
+    """
+    sender = getattr(handlers, _CHANNEL_SENDERS[channel])
+    breaker = get_breaker(channel)
+    bad_recipients = get_bad_recipients()
+
+    results = {}
+    pending = []
+    for recipient in dict.fromkeys(recipients):
+        known_bad = bad_recipients.get(channel, recipient)
+        if known_bad is not None:
+            results[recipient] = dict(known_bad, details=f"recipient previously failed permanently: {known_bad['details']}")
+        else:
+            pending.append(recipient)
+    if not pending:
+        return results
+
+    if not breaker.allow_request():
+        open_result = {"status": "failed", "details": f"{channel} circuit open; provider calls suspended",
+                       "error_class": errors.PROVIDER, "retryable": True, "circuit_open": True}
+        results.update((r, dict(open_result)) for r in pending)
+        return results
+
+    try:
+        with span(f'provider:{channel}', recipients=len(pending)):
+            batch = sender(pending, message)['results']
+    except Exception:
+        breaker.record_failure()
+        raise
+
+    # The provider is unhealthy only if nobody got through and every failure was transient
+    if any(r['status'] == 'sent' or not errors.is_retryable(r) for r in batch.values()):
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+    for recipient, result in batch.items():
+        if result.get('error_class') in errors.RECIPIENT_ERRORS:
+            bad_recipients.add(channel, recipient, result)
+    results.update(batch)
+    return results
@@ -0,0 +1,199 @@
+import hmac
+import json
+import time
+import heapq
+import random
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import select
+
+from app.models import get_engine, APIKey
+from app.utils.config import config_section
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-AlertBot-Signature'
+TIMESTAMP_HEADER = 'X-AlertBot-Timestamp'
+
+# Delivery outcomes reported to clients. Every message the caller did not get
+# a final synchronous answer for ends in `sent` or `dead_lettered`; each time
+# it is (re)scheduled for retry in between, a `retrying` event is sent.
+EVENTS = ('sent', 'retrying', 'dead_lettered')
+
+def _config() -> Dict[str, Any]:
+    return config_section('callbacks')
+
+
+def sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """HMAC-SHA256 over "<timestamp>.<body>", formatted as the signature header value."""
+    digest = hmac.new(secret.encode(), timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def verify_signature(secret: str, timestamp: str, body: bytes, signature: str, tolerance: int = 300) -> bool:
+    """Receiver-side check: signature matches and the timestamp is recent."""
+    try:
+        if abs(time.time() - int(timestamp)) > tolerance:
+            return False
+    except (TypeError, ValueError):
+        return False
+    return hmac.compare_digest(sign_payload(secret, timestamp, body), signature or '')
+
+
+class CallbackDispatcher:
+    """
+    Buffers outcome events per API key and POSTs them to the key's callback
+    URL in batches over a pooled HTTP session. A batch is flushed when it
+    reaches `batch_size` or after `flush_interval` seconds; failed deliveries
+    are retried with jittered exponential backoff, then dropped.
+    """
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.batch_size = settings.get('batch_size', 100)
+        self.flush_interval = settings.get('flush_interval', 2)
+        self.max_buffer = settings.get('max_buffer', 10000)
+        self.max_attempts = settings.get('max_attempts', 6)
+        self.base_delay = settings.get('base_delay', 2)
+        self.max_delay = settings.get('max_delay', 300)
+        self.timeout = settings.get('timeout', 10)
+        self.target_ttl = settings.get('target_cache_ttl', 60)
+        workers = settings.get('workers', 4)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='callback')
+
+        self._pending: Dict[int, List[Dict[str, Any]]] = {}
+        self._buffered = 0
+        self._retries: List[Tuple[float, int, int, List[Dict[str, Any]], int]] = []
+        self._seq = 0
+        self._targets: Dict[int, Tuple[float, Optional[Tuple[str, str]]]] = {}
+        self._cond = threading.Condition()
+        self.stats = {"delivered": 0, "failed_attempts": 0, "dropped": 0}
+        threading.Thread(target=self._run, name="callback-flusher", daemon=True).start()
+
+    def _target(self, api_key_id: int) -> Optional[Tuple[str, str]]:
+        """(url, secret) for a key, cached for target_cache_ttl seconds."""
+        now = time.monotonic()
+        cached = self._targets.get(api_key_id)
+        if cached and cached[0] > now:
+            return cached[1]
+        # emit() runs on the caller's thread: use a connection of our own so
+        # the caller's scoped session, and the objects it still holds, stay put
+        with get_engine().connect() as conn:
+            row = conn.execute(
+                select(APIKey.callback_url, APIKey.callback_secret).where(APIKey.id == api_key_id)
+            ).first()
+        target = (row[0], row[1]) if row and row[0] and row[1] else None
+        self._targets[api_key_id] = (now + self.target_ttl, target)
+        return target
+
+    def invalidate(self, api_key_id: int):
+        self._targets.pop(api_key_id, None)
+
+    def emit(self, api_key_id: Optional[int], event: str, **fields):
+        if api_key_id is None or self._target(api_key_id) is None:
+            return
+        record = {"event": event, "at": datetime.utcnow().isoformat()}
+        record.update(fields)
+        with self._cond:
+            if self._buffered >= self.max_buffer:
+                self.stats["dropped"] += 1
+                return
+            batch = self._pending.setdefault(api_key_id, [])
+            batch.append(record)
+            self._buffered += 1
+            if len(batch) >= self.batch_size:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(self.flush_interval)
+                ready = []
+                for api_key_id, events in self._pending.items():
+                    for i in range(0, len(events), self.batch_size):
+                        ready.append((api_key_id, events[i:i + self.batch_size], 0))
+                self._pending = {}
+                self._buffered = 0
+                now = time.monotonic()
+                while self._retries and self._retries[0][0] <= now:
+                    _, _, api_key_id, events, attempt = heapq.heappop(self._retries)
+                    ready.append((api_key_id, events, attempt))
+
+            for api_key_id, events, attempt in ready:
+                self._executor.submit(self._deliver, api_key_id, events, attempt)
+
+    def _deliver(self, api_key_id: int, events: List[Dict[str, Any]], attempt: int):
+        target = self._target(api_key_id)
+        if target is None:
+            return
+        url, secret = target
+        body = json.dumps({"events": events}).encode()
+        timestamp = str(int(time.time()))
+        headers = {
+            'Content-Type': 'application/json',
+            TIMESTAMP_HEADER: timestamp,
+            SIGNATURE_HEADER: sign_payload(secret, timestamp, body),
+        }
+        try:
+            response = self.session.post(url, data=body, headers=headers, timeout=self.timeout)
+            if 200 <= response.status_code < 300:
+                with self._cond:
+                    self.stats["delivered"] += len(events)
+                return
+            error = f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = str(e)
+
+        attempt += 1
+        exhausted = attempt >= self.max_attempts
+        with self._cond:
+            self.stats["failed_attempts"] += 1
+            if exhausted:
+                self.stats["dropped"] += len(events)
+        if exhausted:
+            logger.warning("Dropping %s callback events for key %s after %s attempts: %s",
+                           len(events), api_key_id, attempt, error)
+            return
+        delay = min(self.base_delay * (2 ** attempt), self.max_delay)
+        due = time.monotonic() + random.uniform(delay / 2, delay)
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._retries, (due, self._seq, api_key_id, events, attempt))
+
+    def status(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self.stats, buffered=self._buffered, awaiting_retry=len(self._retries))
+
+
+_dispatcher: Optional[CallbackDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_callbacks() -> CallbackDispatcher:
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = CallbackDispatcher(_config())
+        return _dispatcher
+
+
+def emit(api_key_id: Optional[int], event: str, **fields):
+    """Report a delivery outcome to the owning key's callback URL, if it has one."""
+    if api_key_id is None:
+        return
+    try:
+        get_callbacks().emit(api_key_id, event, **fields)
+    except Exception:
+        # Receipts are best-effort; never let them break delivery
+        logger.exception("Failed to buffer callback event")
@@ -0,0 +1,405 @@
+import json
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from app.models import get_session, DeadLetter, MessageLog, ReplayJob
+from app.dispatcher import dispatch, DEFAULT_PRIORITY
+from app.handlers.errors import is_retryable
+from app.bodies import prefetch_bodies
+from app.tracing import traced, span
+from app.callbacks import emit
+from app.utils.config import config_section
+
+logger = logging.getLogger(__name__)
+
+def _config() -> Dict[str, Any]:
+    return config_section('dead_letter')
+
+
+def append_failure(history: Optional[str], result: Optional[Dict]) -> str:
+    """Add one failed attempt to a JSON failure history, keeping the newest entries."""
+    entries = json.loads(history) if history else []
+    entries.append({
+        "at": datetime.utcnow().isoformat(),
+        "error_class": (result or {}).get('error_class', 'unknown'),
+        "details": str((result or {}).get('details', 'no result'))[:500],
+    })
+    return json.dumps(entries[-_config().get('history_limit', 10):])
+
+
+def dead_letter(db, item, reason: str) -> DeadLetter:
+    """Copy a RetryQueue item into dead_letters inside the caller's transaction."""
+    history = json.loads(item.failure_history) if item.failure_history else []
+    letter = DeadLetter(
+        channel=item.channel,
+        recipient=item.recipient,
+        message=item.message,
+        body_hash=item.body_hash,
+        priority=item.priority or DEFAULT_PRIORITY,
+        attempts=item.attempts,
+        reason=reason,
+        last_error_class=history[-1]['error_class'] if history else None,
+        failure_history=item.failure_history,
+        api_key_id=item.api_key_id,
+        message_log_id=item.message_log_id,
+        first_queued_at=item.created_at
+    )
+    db.add(letter)
+    return letter
+
+
+def dead_letter_failure(db, channel: str, recipient: str, fields: Dict[str, str], priority: int,
+                        result: Dict, api_key_id: Optional[int] = None,
+                        message_log_id: Optional[int] = None) -> DeadLetter:
+    """Dead-letter a first-attempt permanent failure that never entered the retry queue."""
+    letter = DeadLetter(
+        channel=channel,
+        recipient=recipient,
+        **fields,
+        priority=priority or DEFAULT_PRIORITY,
+        attempts=1,
+        reason='permanent',
+        last_error_class=result.get('error_class', 'unknown'),
+        failure_history=append_failure(None, result),
+        api_key_id=api_key_id,
+        message_log_id=message_log_id,
+        first_queued_at=datetime.utcnow()
+    )
+    db.add(letter)
+    return letter
+
+
+def _filtered(query, filters: Dict[str, Any]):
+    if filters.get('ids'):
+        query = query.filter(DeadLetter.id.in_(filters['ids']))
+    for field in ('channel', 'recipient', 'reason', 'status'):
+        if filters.get(field):
+            query = query.filter(getattr(DeadLetter, field) == filters[field])
+    if filters.get('error_class'):
+        query = query.filter(DeadLetter.last_error_class == filters['error_class'])
+    if filters.get('since'):
+        query = query.filter(DeadLetter.created_at >= filters['since'])
+    if filters.get('until'):
+        query = query.filter(DeadLetter.created_at < filters['until'])
+    return query
+
+
+def _as_dict(letter: DeadLetter) -> Dict[str, Any]:
+    return {
+        "id": letter.id,
+        "channel": letter.channel,
+        "recipient": letter.recipient,
+        "message": letter.message_text,
+        "priority": letter.priority,
+        "attempts": letter.attempts,
+        "reason": letter.reason,
+        "status": letter.status,
+        "last_error_class": letter.last_error_class,
+        "failure_history": json.loads(letter.failure_history) if letter.failure_history else [],
+        "replay_count": letter.replay_count,
+        "first_queued_at": letter.first_queued_at.isoformat() if letter.first_queued_at else None,
+        "created_at": letter.created_at.isoformat() if letter.created_at else None,
+    }
+
+
+def list_dead_letters(filters: Dict[str, Any], limit: int = 100, after_id: int = 0) -> List[Dict[str, Any]]:
+    db = get_session()
+    try:
+        letters = (
+            _filtered(db.query(DeadLetter), filters)
+            .filter(DeadLetter.id > after_id)
+            .order_by(DeadLetter.id)
+            .limit(limit)
+            .all()
+        )
+        prefetch_bodies(letter.body_hash for letter in letters)
+        return [_as_dict(letter) for letter in letters]
+    finally:
+        db.close()
+
+
+def dead_letter_summary() -> Dict[str, Dict[str, int]]:
+    """Counts per channel and per status."""
+    from sqlalchemy import func
+
+    db = get_session()
+    try:
+        rows = db.query(DeadLetter.channel, DeadLetter.status, func.count(DeadLetter.id)) \
+            .group_by(DeadLetter.channel, DeadLetter.status).all()
+        summary: Dict[str, Dict[str, int]] = {}
+        for channel, status, count in rows:
+            summary.setdefault(channel, {})[status] = count
+        return summary
+    finally:
+        db.close()
+
+
+def purge_dead_letters(filters: Dict[str, Any]) -> int:
+    db = get_session()
+    try:
+        # Never pull rows out from under a running replay
+        query = _filtered(db.query(DeadLetter), filters).filter(DeadLetter.status != 'sending')
+        deleted = query.delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+class ReplayWorker:
+    """
+    Background replay of queued dead letters through the normal dispatch
+    pipeline. Runs only in the leader (started by the scheduler's
+    resume_replay), one replay job at a time, oldest first, so the send rate
+    is always the one stored with the job being drained. Rows are claimed in
+    batches of the job's `concurrency` with a per-process token, and each
+    batch is paced so the run stays under the job's `rate` messages per second.
+    """
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def ensure_running(self):
+        with self._lock:
+            if not self.running():
+                self._thread = threading.Thread(target=self._run, name="dead-letter-replay", daemon=True)
+                self._thread.start()
+
+    def _current_job(self) -> Optional[Dict[str, Any]]:
+        """The oldest active job with letters left, closing any that are finished."""
+        db = get_session()
+        try:
+            stale = datetime.utcnow() - timedelta(seconds=_config().get('claim_timeout', 600))
+            # Rows held by a worker that died mid-replay go back in the queue
+            db.query(DeadLetter).filter(
+                DeadLetter.status == 'sending',
+                DeadLetter.claimed_at < stale
+            ).update({"status": 'queued', "claimed_by": None}, synchronize_session=False)
+
+            job = None
+            for candidate in db.query(ReplayJob).filter_by(status='active').order_by(ReplayJob.id):
+                left = db.query(DeadLetter.id).filter(
+                    DeadLetter.replay_job_id == candidate.id,
+                    DeadLetter.status.in_(('queued', 'sending'))
+                ).first()
+                if left:
+                    job = {"id": candidate.id, "rate": candidate.rate, "concurrency": candidate.concurrency}
+                    break
+                candidate.status, candidate.completed_at = 'done', datetime.utcnow()
+
+            if job is None:
+                active = [row.id for row in db.query(ReplayJob.id).filter_by(status='active')]
+                # Queued rows whose job was cancelled (e.g. reclaimed after a crash) go back to rest
+                db.query(DeadLetter).filter(
+                    DeadLetter.status == 'queued',
+                    DeadLetter.replay_job_id.isnot(None),
+                    DeadLetter.replay_job_id.notin_(active)
+                ).update({"status": 'dead'}, synchronize_session=False)
+                # Rows queued before replay jobs existed replay at the configured defaults
+                if db.query(DeadLetter.id).filter(DeadLetter.status == 'queued',
+                                                  DeadLetter.replay_job_id.is_(None)).first():
+                    job = {"id": None, "rate": float(_config().get('replay_rate', 5)),
+                           "concurrency": int(_config().get('replay_concurrency', 5))}
+            db.commit()
+            return job
+        finally:
+            db.close()
+
+    def _claim(self, job: Dict[str, Any]) -> List[Dict[str, Any]]:
+        db = get_session()
+        try:
+            in_job = (DeadLetter.replay_job_id == job['id'] if job['id'] is not None
+                      else DeadLetter.replay_job_id.is_(None))
+            ids = [row.id for row in db.query(DeadLetter.id)
+                   .filter(DeadLetter.status == 'queued', in_job)
+                   .order_by(DeadLetter.priority, DeadLetter.id)
+                   .limit(job['concurrency'])]
+            if ids:
+                db.query(DeadLetter).filter(
+                    DeadLetter.id.in_(ids),
+                    DeadLetter.status == 'queued'
+                ).update({"status": 'sending', "claimed_by": self.token, "claimed_at": datetime.utcnow()},
+                         synchronize_session=False)
+            db.commit()
+            letters = db.query(DeadLetter).filter_by(status='sending', claimed_by=self.token).all()
+            prefetch_bodies(letter.body_hash for letter in letters)
+            return [
+                {"id": l.id, "channel": l.channel, "recipient": l.recipient,
+                 "message": l.message_text, "priority": l.priority or DEFAULT_PRIORITY}
+                for l in letters
+            ]
+        finally:
+            db.close()
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                # Re-read the job every batch so a cancel stops the run promptly
+                job = self._current_job()
+                if job is None:
+                    return
+                letters = self._claim(job)
+                if not letters:
+                    # What is left is still held by another (possibly dead) worker
+                    time.sleep(_config().get('poll_interval', 5))
+                    continue
+                with traced('dead_letter_replay', batch=len(letters)):
+                    paused = self._replay_batch(letters)
+            except Exception:
+                logger.exception("Dead-letter replay batch failed")
+                return
+
+            if paused:
+                logger.warning("Dead-letter replay paused: circuit open or bulkhead full")
+                time.sleep(_config().get('circuit_pause', 30))
+                continue
+            # Pace batches so the run averages at most `rate` sends per second
+            remaining = len(letters) / job['rate'] - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def _replay_batch(self, letters: List[Dict[str, Any]]) -> bool:
+        """
+        Send one claimed batch and record outcomes. Transient failures leave
+        dead_letters for the retry queue, with backoff like any other send;
+        permanent ones go back to rest. Returns True if a circuit was open.
+        """
+        from app.queue import add_to_retry_queue
+
+        futures = [dispatch(l['channel'], l['recipient'], l['message'], l['priority']) for l in letters]
+        outcomes = []
+        for letter, future in zip(letters, futures):
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append({"status": "failed", "details": str(e)})
+
+        paused = False
+        receipts = []
+        db = get_session()
+        try:
+            with span('db_write'):
+                for letter, result in zip(letters, outcomes):
+                    row = db.get(DeadLetter, letter['id'])
+                    if row is None or row.claimed_by != self.token:
+                        continue
+                    if result.get('circuit_open') or result.get('bulkhead_full'):
+                        # Provider still down or its bulkhead is saturated; hand the row back untouched
+                        row.status, row.claimed_by = 'queued', None
+                        paused = True
+                        continue
+
+                    log = MessageLog(
+                        channel=row.channel,
+                        recipient=row.recipient,
+                        message=row.message,
+                        body_hash=row.body_hash,
+                        status=result['status'],
+                        details=result.get('details', ''),
+                        retry_count=row.attempts,
+                        priority=row.priority,
+                        api_key_id=row.api_key_id
+                    )
+                    db.add(log)
+                    receipt = {"message_id": row.message_log_id, "channel": row.channel,
+                               "recipient": row.recipient, "replayed": True}
+                    if result['status'] == 'sent':
+                        receipts.append((row.api_key_id, 'sent', receipt))
+                        db.delete(row)
+                    elif is_retryable(result):
+                        next_retry = add_to_retry_queue(row.channel, row.recipient, letter['message'],
+                                                        row.priority or DEFAULT_PRIORITY, api_key_id=row.api_key_id,
+                                                        message_log_id=row.message_log_id, db=db)
+                        receipts.append((row.api_key_id, 'retrying', dict(
+                            receipt, attempts=0, error_class=result.get('error_class'),
+                            details=result.get('details'), next_retry=next_retry.isoformat())))
+                        db.delete(row)
+                    else:
+                        receipts.append((row.api_key_id, 'dead_lettered', dict(
+                            receipt, error_class=result.get('error_class'), details=result.get('details'))))
+                        row.failure_history = append_failure(row.failure_history, result)
+                        row.last_error_class = result.get('error_class', 'unknown')
+                        row.replay_count = (row.replay_count or 0) + 1
+                        row.status, row.claimed_by = 'dead', None
+                db.commit()
+        finally:
+            db.close()
+
+        for api_key_id, event, fields in receipts:
+            emit(api_key_id, event, **fields)
+        return paused
+
+
+_worker: Optional[ReplayWorker] = None
+_worker_lock = threading.Lock()
+
+
+def get_replay_worker() -> ReplayWorker:
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = ReplayWorker()
+        return _worker
+
+
+def queue_replay(filters: Dict[str, Any], rate: Optional[float] = None,
+                 concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Record a replay job and mark the matching dead letters as queued for it.
+    Nothing is sent here: the leader's scheduler picks the job up within
+    dead_letter.poll_interval seconds and replays at the job's own rate.
+    """
+    rate = float(rate or _config().get('replay_rate', 5))
+    concurrency = int(concurrency or _config().get('replay_concurrency', 5))
+    db = get_session()
+    try:
+        job = ReplayJob(rate=rate, concurrency=concurrency)
+        db.add(job)
+        db.flush()
+        query = _filtered(db.query(DeadLetter), filters).filter(DeadLetter.status == 'dead')
+        queued = query.update({"status": 'queued', "replay_job_id": job.id}, synchronize_session=False)
+        job.queued = queued
+        if not queued:
+            job.status, job.completed_at = 'done', datetime.utcnow()
+        db.commit()
+        return {"job_id": job.id, "queued": queued, "rate": rate, "concurrency": concurrency}
+    finally:
+        db.close()
+
+
+def cancel_replay() -> int:
+    """Cancel active replay jobs and return their unclaimed letters to the dead state."""
+    db = get_session()
+    try:
+        cancelled = db.query(DeadLetter).filter(DeadLetter.status == 'queued') \
+            .update({"status": 'dead'}, synchronize_session=False)
+        db.query(ReplayJob).filter_by(status='active') \
+            .update({"status": 'cancelled', "completed_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        return cancelled
+    finally:
+        db.close()
+
+
+def resume_replay():
+    """
+    Scheduler hook, so it only runs in the leader: start the replay worker
+    when a replay job (or a replay left behind by a restart) is pending.
+    """
+    db = get_session()
+    try:
+        pending = db.query(DeadLetter.id).filter(DeadLetter.status.in_(('queued', 'sending'))).first()
+    finally:
+        db.close()
+    if pending:
+        get_replay_worker().ensure_running()
@@ -0,0 +1,286 @@
+import time
+import threading
+import contextvars
+import logging
+from collections import deque
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from app.tracing import current_trace
+from app.utils.config import config_section
+
+logger = logging.getLogger(__name__)
+
+# Lower number = more urgent. P1 is for pages that must go out immediately.
+PRIORITIES = {'high': 1, 'normal': 2, 'low': 3}
+DEFAULT_PRIORITY = PRIORITIES['normal']
+
+
+def parse_priority(value) -> int:
+    """Accept 1-3 or high/normal/low; None means normal. Raises ValueError."""
+    if value is None or value == '':
+        return DEFAULT_PRIORITY
+    if isinstance(value, str) and value.strip().lower() in PRIORITIES:
+        return PRIORITIES[value.strip().lower()]
+    priority = int(value)
+    if priority not in PRIORITIES.values():
+        raise ValueError(f"priority must be one of {sorted(PRIORITIES.values())} or {list(PRIORITIES)}")
+    return priority
+
+
+class BulkheadFull(Exception):
+    """A dispatcher's bounded queue has no room for another job."""
+
+
+class PriorityDispatcher:
+    """
+    Runs submitted jobs on a fixed pool of worker threads, one FIFO lane per
+    priority. Lanes are served by smooth weighted round-robin, so urgent lanes
+    get most of the capacity without starving the rest, and each lane can
+    reserve worker slots that other lanes may never occupy. With `max_queued`
+    set, each lane holds at most that many jobs and submit() raises
+    BulkheadFull instead of letting its backlog grow; a flood in one lane
+    never takes queue space from another.
+    """
+
+    def __init__(self, workers: int, weights: Dict[int, int], reserved: Dict[int, int],
+                 max_queued: Optional[int] = None, name: str = 'dispatch'):
+        self.workers = workers
+        self.weights = weights
+        self.reserved = reserved
+        self.max_queued = max_queued
+        self.rejected = 0
+        self.lanes = {p: deque() for p in sorted(weights)}
+        self.running = {p: 0 for p in self.lanes}
+        self._current = {p: 0 for p in self.lanes}
+        self._cond = threading.Condition()
+        self._threads = []
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, priority: int, fn: Callable, *args, **kwargs) -> Future:
+        future = Future()
+        if priority not in self.lanes:
+            priority = DEFAULT_PRIORITY
+        # Run the job in the submitter's context so its spans land in the caller's trace
+        ctx = contextvars.copy_context()
+        with self._cond:
+            if self.max_queued is not None and len(self.lanes[priority]) >= self.max_queued:
+                self.rejected += 1
+                raise BulkheadFull(f"{self.max_queued} P{priority} jobs already queued")
+            self.lanes[priority].append((future, ctx, time.perf_counter(), fn, args, kwargs))
+            self._cond.notify_all()
+        return future
+
+    def free_slots(self, priority: int) -> Optional[int]:
+        """Jobs the lane can still queue right now; None when unbounded."""
+        if self.max_queued is None:
+            return None
+        if priority not in self.lanes:
+            priority = DEFAULT_PRIORITY
+        with self._cond:
+            return max(0, self.max_queued - len(self.lanes[priority]))
+
+    def _can_start(self, priority: int) -> bool:
+        held = sum(max(0, self.reserved.get(p, 0) - self.running[p]) for p in self.lanes if p != priority)
+        return sum(self.running.values()) + held < self.workers
+
+    def _next_lane(self) -> Optional[int]:
+        candidates = [p for p, lane in self.lanes.items() if lane and self._can_start(p)]
+        if not candidates:
+            return None
+        total = sum(self.weights[p] for p in candidates)
+        for p in candidates:
+            self._current[p] += self.weights[p]
+        chosen = max(candidates, key=lambda p: (self._current[p], -p))
+        self._current[chosen] -= total
+        return chosen
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                priority = self._next_lane()
+                while priority is None:
+                    self._cond.wait()
+                    priority = self._next_lane()
+                future, ctx, enqueued, fn, args, kwargs = self.lanes[priority].popleft()
+                self.running[priority] += 1
+
+            trace = ctx.run(current_trace)
+            if trace is not None:
+                trace.add_span('queue_wait', enqueued, time.perf_counter(), priority=priority)
+
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(ctx.run(fn, *args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._cond:
+                    self.running[priority] -= 1
+                    self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            running = sum(self.running.values())
+            queued = sum(len(lane) for lane in self.lanes.values())
+            return {
+                "workers": self.workers,
+                "running": running,
+                "queued": queued,
+                "max_queued": self.max_queued * len(self.lanes) if self.max_queued is not None else None,
+                "rejected": self.rejected,
+                "saturation": round(running / self.workers, 2) if self.workers else 1.0,
+                "lanes": {
+                    f"P{p}": {
+                        "queued": len(self.lanes[p]),
+                        "max_queued": self.max_queued,
+                        "running": self.running[p],
+                        "weight": self.weights[p],
+                        "reserved": self.reserved.get(p, 0),
+                    }
+                    for p in self.lanes
+                },
+            }
+
+
+# One dispatcher per channel (a bulkhead): a slow provider can only tie up
+# its own workers and queue, never another channel's.
+_dispatchers: Dict[str, PriorityDispatcher] = {}
+_dispatcher_lock = threading.Lock()
+
+
+def bulkhead_settings(channel: str) -> Dict[str, Any]:
+    """bulkheads.default overlaid with bulkheads.<channel>."""
+    bulkheads = config_section('bulkheads')
+    settings = {"workers": 4, "max_queue": 100, "max_wait": 5, "rejection": "retry"}
+    settings.update(bulkheads.get('default', {}))
+    settings.update(bulkheads.get(channel, {}))
+    return settings
+
+
+def get_dispatcher(channel: str) -> PriorityDispatcher:
+    with _dispatcher_lock:
+        if channel not in _dispatchers:
+            priority = config_section('priority')
+            settings = bulkhead_settings(channel)
+            workers = settings['workers']
+            weights = {int(p): w for p, w in priority.get('weights', {"1": 6, "2": 3, "3": 1}).items()}
+            # Keep at least one slot a lower lane can use, however small the bulkhead
+            reserved = {int(p): min(n, max(workers - 1, 0))
+                        for p, n in priority.get('reserved', {"1": 2}).items()}
+            _dispatchers[channel] = PriorityDispatcher(
+                workers, weights, reserved, max_queued=settings['max_queue'], name=f"dispatch-{channel}"
+            )
+        return _dispatchers[channel]
+
+
+def dispatch_stats() -> Dict[str, Dict[str, Any]]:
+    from app.breaker import CHANNELS
+    return {channel: get_dispatcher(channel).stats() for channel in CHANNELS}
+
+
+def dispatch(channel: str, recipient: str, message: str, priority: int = DEFAULT_PRIORITY) -> Future:
+    """
+    Queue a guarded channel send in its channel's bulkhead and priority lane;
+    returns a Future of the result dict. When the bulkhead is full the Future
+    is already resolved with a failure marked bulkhead_full=True, retryable
+    unless the channel's rejection policy is "fail".
+    """
+    from app.breaker import guarded_send
+
+    try:
+        return get_dispatcher(channel).submit(priority, guarded_send, channel, recipient, message)
+    except BulkheadFull as e:
+        future = Future()
+        future.set_result(_rejection(channel, e))
+        return future
+
+
+def _rejection(channel: str, e: BulkheadFull) -> Dict[str, Any]:
+    from app.handlers import errors
+
+    retryable = bulkhead_settings(channel)['rejection'] != 'fail'
+    result = errors.failed(f"{channel} bulkhead full: {e}", error_class=errors.OVERLOADED, retryable=retryable)
+    result["bulkhead_full"] = True
+    return result
+
+
+def await_results(channel: str, futures: Dict[str, Future]) -> Dict[str, Dict[str, Any]]:
+    """
+    Wait for dispatched sends, giving each at most the bulkhead's `max_wait`
+    seconds to reach a worker. A job still queued at the deadline is
+    cancelled and resolves as an `overloaded` failure marked
+    bulkhead_full=True, retryable unless the rejection policy is "fail", so
+    a request thread never queues behind a slow provider. A job already
+    running is awaited; the provider call's own timeout bounds it.
+    """
+    max_wait = bulkhead_settings(channel)['max_wait']
+    wait(futures.values(), timeout=max_wait)
+    results = {}
+    for key, future in futures.items():
+        # Recipients of one batch are cancelled together
+        if future.cancelled() or (not future.done() and future.cancel()):
+            results[key] = _rejection(channel, BulkheadFull(f"no worker free within {max_wait}s"))
+        else:
+            results[key] = future.result()
+    return results
+
+
+def await_result(channel: str, future: Future) -> Dict[str, Any]:
+    """await_results() for a single dispatched send."""
+    return await_results(channel, {None: future})[None]
+
+
+class _BatchFuture(Future):
+    """One recipient's share of a batch job; cancelling it cancels the batch while still queued."""
+
+    def __init__(self, batch: Future):
+        super().__init__()
+        self._batch = batch
+
+    def cancel(self) -> bool:
+        if not self._batch.cancel():
+            return False
+        return super().cancel()
+
+
+def dispatch_many(channel: str, recipients: List[str], message: str,
+                  priority: int = DEFAULT_PRIORITY) -> Dict[str, Future]:
+    """
+    Send one message to several recipients of a BATCH_CHANNELS channel as a
+    single job in its bulkhead. Returns a Future per recipient, all resolved
+    together when the batch finishes; cancelling one while the batch is still
+    queued cancels the batch and every recipient's Future.
+    """
+    from app.breaker import guarded_send_many
+
+    recipients = list(dict.fromkeys(recipients))
+    try:
+        batch = get_dispatcher(channel).submit(priority, guarded_send_many, channel, recipients, message)
+    except BulkheadFull as e:
+        futures = {r: Future() for r in recipients}
+        for future in futures.values():
+            future.set_result(_rejection(channel, e))
+        return futures
+    futures = {r: _BatchFuture(batch) for r in recipients}
+
+    def _fan_out(done: Future):
+        if done.cancelled():
+            for future in futures.values():
+                Future.cancel(future)
+            return
+        try:
+            results = done.result()
+        except BaseException as e:
+            for future in futures.values():
+                future.set_exception(e)
+            return
+        for recipient, future in futures.items():
+            future.set_result(results[recipient])
+
+    batch.add_done_callback(_fan_out)
+    return futures
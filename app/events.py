@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import queue
+import logging
+import calendar
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, Optional
+
+from app.breaker import CHANNELS, breaker_states
+from app.dispatcher import dispatch_stats
+from app.utils.config import config_section
+
+logger = logging.getLogger(__name__)
+
+def _config() -> Dict[str, Any]:
+    return config_section('dashboard')
+
+
+class RollingCounters:
+    """Sent/failed totals per channel over the last `window` seconds, kept in fixed-size buckets."""
+
+    def __init__(self, window: int = 300, bucket: int = 10):
+        self.window = window
+        self.bucket = bucket
+        self._buckets: "deque[tuple]" = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+
+    def add(self, channel: str, status: str, n: int = 1, at: Optional[float] = None):
+        now = time.time()
+        at = now if at is None else at
+        start = at - at % self.bucket
+        with self._lock:
+            self._trim(now)
+            if start <= now - self.window:
+                return
+            # Seeding walks newest-first, so an older bucket may need inserting
+            index = len(self._buckets)
+            while index and self._buckets[index - 1][0] > start:
+                index -= 1
+            if not index or self._buckets[index - 1][0] != start:
+                self._buckets.insert(index, (start, {}))
+                index += 1
+            counts = self._buckets[index - 1][1].setdefault(channel, {"sent": 0, "failed": 0})
+            counts["sent" if status == 'sent' else "failed"] += n
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        totals = {channel: {"sent": 0, "failed": 0} for channel in CHANNELS}
+        with self._lock:
+            self._trim(time.time())
+            for _, counts in self._buckets:
+                for channel, c in counts.items():
+                    t = totals.setdefault(channel, {"sent": 0, "failed": 0})
+                    t["sent"] += c["sent"]
+                    t["failed"] += c["failed"]
+        return totals
+
+
+class EventBus:
+    """
+    Per-process fan-out for the live admin dashboard. While at least one
+    viewer is connected, a single poller thread reads new message_logs rows
+    past a high-water mark every `stream_tick` seconds, so every viewer sees
+    rows written by any worker (and by the leader's broadcast and replay
+    threads) at the cost of one query per process per tick. Each viewer
+    holds a bounded queue; one that falls behind loses events rather than
+    slowing the poller down.
+    """
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.max_viewers = settings.get('max_viewers', 4)
+        self.queue_size = settings.get('queue_size', 1000)
+        self.depth_refresh = settings.get('depth_refresh', 5)
+        self.tick = settings.get('stream_tick', 2)
+        self.poll_limit = settings.get('poll_limit', 500)
+        self.seed_rows = settings.get('seed_rows', 5000)
+        self.counters = RollingCounters(settings.get('counter_window', 300))
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._poller: Optional[threading.Thread] = None
+        self._high_water: Optional[int] = None
+        self._retry_depth: Optional[int] = None
+        self._depth_checked = 0.0
+        self.dropped = 0
+
+    def subscribe(self) -> Optional[queue.Queue]:
+        with self._lock:
+            if len(self._subscribers) >= self.max_viewers:
+                return None
+            q = queue.Queue(maxsize=self.queue_size)
+            self._subscribers.add(q)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name="dashboard-poller", daemon=True)
+                self._poller.start()
+            return q
+
+    def unsubscribe(self, q: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def viewers(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, kind: str, data: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait((kind, data))
+            except queue.Full:
+                self.dropped += 1
+
+    def _poll_loop(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Nobody is watching: stop, and reseed on the next viewer
+                    self._poller = None
+                    self._high_water = None
+                    return
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Dashboard log poll failed")
+            time.sleep(self.tick)
+
+    def poll(self):
+        """Publish message_logs rows written since the last poll, by any worker."""
+        from app.models import get_session, MessageLog
+        from app.bodies import prefetch_bodies
+
+        db = get_session()
+        try:
+            if self._high_water is None:
+                # Fill the counter window from the newest rows; they are not re-published
+                self.counters = RollingCounters(self.counters.window)
+                since = datetime.utcnow() - timedelta(seconds=self.counters.window)
+                recent = (db.query(MessageLog.id, MessageLog.channel, MessageLog.status, MessageLog.created_at)
+                          .order_by(MessageLog.id.desc()).limit(self.seed_rows).all())
+                for _, channel, status, created_at in recent:
+                    if created_at and created_at >= since:
+                        self.counters.add(channel, status, at=calendar.timegm(created_at.timetuple()))
+                self._high_water = recent[0][0] if recent else 0
+                return
+
+            logs = (db.query(MessageLog).filter(MessageLog.id > self._high_water)
+                    .order_by(MessageLog.id).limit(self.poll_limit).all())
+            if not logs:
+                return
+            prefetch_bodies(log.body_hash for log in logs)
+            entries = [log_entry(log, log.message_text) for log in logs]
+            self._high_water = logs[-1].id
+        finally:
+            db.close()
+
+        for entry in entries:
+            self.counters.add(entry['channel'], entry['status'])
+            self.publish('log', entry)
+
+    def retry_depth(self) -> Optional[int]:
+        # At most one COUNT per depth_refresh seconds, however many viewers ask
+        if self._retry_depth is None or time.monotonic() - self._depth_checked > self.depth_refresh:
+            from app.models import get_session, RetryQueue
+            db = get_session()
+            try:
+                self._retry_depth = db.query(RetryQueue).count()
+                self._depth_checked = time.monotonic()
+            finally:
+                db.close()
+        return self._retry_depth
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.counters.window,
+            "channels": self.counters.snapshot(),
+            "retry_queue_depth": self.retry_depth(),
+            # Breakers and bulkheads are per-process state
+            "worker": os.getpid(),
+            "circuit_breakers": {c: s["state"] for c, s in breaker_states().items()},
+            "bulkheads": {
+                c: {k: s[k] for k in ("workers", "running", "queued", "max_queued", "rejected")}
+                for c, s in dispatch_stats().items()
+            },
+        }
+
+
+_bus: Optional[EventBus] = None
+_bus_lock = threading.Lock()
+
+
+def get_event_bus() -> EventBus:
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = EventBus(_config())
+        return _bus
+
+
+def log_entry(log, text: str) -> Dict[str, Any]:
+    """Dashboard view of a MessageLog row; `text` is its message body."""
+    return {
+        "id": log.id,
+        "created_at": log.created_at.strftime('%Y-%m-%d %H:%M:%S') if log.created_at else None,
+        "channel": log.channel,
+        "recipient": log.recipient,
+        "message": text[:50] + ('...' if len(text) > 50 else ''),
+        "priority": log.priority or 2,
+        "status": log.status,
+    }
+
+
+def _sse(kind: str, data: Dict[str, Any]) -> str:
+    return f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_stream(q: queue.Queue) -> Iterator[str]:
+    """
+    Server-Sent Events for one viewer: a counters snapshot on connect and
+    whenever it changes, plus each new log entry from any worker. The stream ends after
+    stream_max_seconds so a sync worker is never held past its timeout;
+    browsers reconnect automatically.
+    """
+    bus = get_event_bus()
+    tick = _config().get('stream_tick', 2)
+    deadline = time.monotonic() + _config().get('stream_max_seconds', 55)
+    try:
+        yield "retry: 2000\n\n"
+        last = bus.snapshot()
+        yield _sse('counters', last)
+        next_tick = time.monotonic() + tick
+        while time.monotonic() < deadline:
+            try:
+                kind, data = q.get(timeout=max(0.0, next_tick - time.monotonic()))
+                yield _sse(kind, data)
+                if time.monotonic() < next_tick:
+                    continue
+            except queue.Empty:
+                pass
+            next_tick = time.monotonic() + tick
+            current = bus.snapshot()
+            if current != last:
+                last = current
+                yield _sse('counters', current)
+            else:
+                yield ": keepalive\n\n"
+    finally:
+        bus.unsubscribe(q)
@@ -0,0 +1,126 @@
+import io
+import csv
+import json
+import zlib
+import base64
+from datetime import datetime
+from typing import Iterator, Optional
+
+from app.models import get_session, MessageLog
+from app.bodies import prefetch_bodies
+
+EXPORT_FIELDS = ['id', 'created_at', 'channel', 'recipient', 'priority', 'status', 'retry_count', 'details', 'message', 'cursor']
+
+# Rows fetched per round trip; memory use stays bounded by this, not by the
+# size of the export.
+BATCH_SIZE = 1000
+
+
+def encode_cursor(log_id: int) -> str:
+    return base64.urlsafe_b64encode(str(log_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> int:
+    """Raises ValueError for malformed tokens."""
+    padded = token + '=' * (-len(token) % 4)
+    try:
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def _batches(rows: Iterator) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_message_logs(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      channel: Optional[str] = None, status: Optional[str] = None,
+                      after_id: int = 0) -> Iterator[dict]:
+    """
+    Yield MessageLog rows as dicts in id order using a server-side cursor.
+    Each row carries a `cursor` token; passing it back resumes after that row.
+    """
+    db = get_session()
+    try:
+        query = db.query(MessageLog).filter(MessageLog.id > after_id)
+        if since:
+            query = query.filter(MessageLog.created_at >= since)
+        if until:
+            query = query.filter(MessageLog.created_at < until)
+        if channel:
+            query = query.filter(MessageLog.channel == channel)
+        if status:
+            query = query.filter(MessageLog.status == status)
+        query = query.order_by(MessageLog.id).execution_options(stream_results=True).yield_per(BATCH_SIZE)
+
+        for logs in _batches(query):
+            # One body lookup per batch; message_text would load them row by row
+            bodies = prefetch_bodies(log.body_hash for log in logs)
+            for log in logs:
+                yield {
+                    "id": log.id,
+                    "created_at": log.created_at.isoformat() if log.created_at else None,
+                    "channel": log.channel,
+                    "recipient": log.recipient,
+                    "priority": log.priority,
+                    "status": log.status,
+                    "retry_count": log.retry_count,
+                    "details": log.details,
+                    "message": bodies.get(log.body_hash, log.message),
+                    "cursor": encode_cursor(log.id),
+                }
+                # Drop the ORM instance so the identity map doesn't grow with the export
+                db.expunge(log)
+    finally:
+        db.close()
+
+
+def ndjson_lines(rows: Iterator[dict]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows: Iterator[dict]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def encode_chunks(lines: Iterator[str], gzip: bool = False, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Coalesce text lines into ~chunk_size byte chunks, optionally gzip-compressed."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    pending = []
+    pending_size = 0
+
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= chunk_size:
+            block = b''.join(pending)
+            pending, pending_size = [], 0
+            if compressor:
+                block = compressor.compress(block)
+                if not block:
+                    continue
+            yield block
+
+    block = b''.join(pending)
+    if compressor:
+        block = compressor.compress(block) + compressor.flush()
+    if block:
+        yield block
@@ -0,0 +1,302 @@
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.models import get_session, RecipientGroup, GroupMember, Broadcast, MessageLog
+from app.breaker import CHANNELS, BATCH_CHANNELS
+from app.dispatcher import dispatch, dispatch_many, DEFAULT_PRIORITY
+from app.handlers.errors import is_retryable
+from app.bodies import body_fields
+from app.callbacks import emit
+from app.deadletter import dead_letter_failure
+
+logger = logging.getLogger(__name__)
+
+Member = Tuple[str, str]
+
+
+class GroupIndex:
+    """
+    In-process cache of group membership. Each entry is tagged with the
+    group's version; a lookup costs one primary-key-sized query to compare
+    versions and only reloads members after another worker changed them.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[int, Tuple[Member, ...]]] = {}
+        self._lock = threading.Lock()
+
+    def members(self, name: str) -> Optional[Tuple[Member, ...]]:
+        db = get_session()
+        try:
+            row = db.query(RecipientGroup.id, RecipientGroup.version).filter_by(name=name).first()
+            if row is None:
+                self.invalidate(name)
+                return None
+            group_id, version = row
+
+            with self._lock:
+                cached = self._entries.get(name)
+            if cached and cached[0] == version:
+                return cached[1]
+
+            members = tuple(
+                db.query(GroupMember.channel, GroupMember.recipient)
+                .filter_by(group_id=group_id)
+                .order_by(GroupMember.id)
+                .all()
+            )
+            with self._lock:
+                self._entries[name] = (version, members)
+            return members
+        finally:
+            db.close()
+
+    def invalidate(self, name: str):
+        with self._lock:
+            self._entries.pop(name, None)
+
+
+group_index = GroupIndex()
+
+
+def normalize_members(raw) -> List[Member]:
+    """Validate [{"channel": ..., "recipient": ...}] input; raises ValueError."""
+    members = []
+    for entry in raw or []:
+        channel = (entry or {}).get('channel')
+        recipient = str((entry or {}).get('recipient') or '').strip()
+        if channel not in CHANNELS or not recipient:
+            raise ValueError(f"invalid member: {entry}")
+        members.append((channel, recipient))
+    return list(dict.fromkeys(members))
+
+
+def create_group(name: str) -> bool:
+    db = get_session()
+    try:
+        if db.query(RecipientGroup.id).filter_by(name=name).first():
+            return False
+        db.add(RecipientGroup(name=name))
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def delete_group(name: str) -> bool:
+    db = get_session()
+    try:
+        group = db.query(RecipientGroup).filter_by(name=name).first()
+        if not group:
+            return False
+        db.query(GroupMember).filter_by(group_id=group.id).delete()
+        db.delete(group)
+        db.commit()
+        group_index.invalidate(name)
+        return True
+    finally:
+        db.close()
+
+
+def update_members(name: str, add: List[Member] = (), remove: List[Member] = ()) -> Optional[int]:
+    """Apply membership changes and bump the version. Returns member count, or None if no such group."""
+    db = get_session()
+    try:
+        group = db.query(RecipientGroup).filter_by(name=name).first()
+        if not group:
+            return None
+
+        existing = set(db.query(GroupMember.channel, GroupMember.recipient).filter_by(group_id=group.id).all())
+        new = [m for m in add if m not in existing]
+        db.add_all([GroupMember(group_id=group.id, channel=c, recipient=r) for c, r in new])
+        for channel, recipient in remove:
+            db.query(GroupMember).filter_by(group_id=group.id, channel=channel, recipient=recipient).delete()
+
+        group.version = (group.version or 0) + 1
+        db.commit()
+        group_index.invalidate(name)
+        return db.query(GroupMember).filter_by(group_id=group.id).count()
+    finally:
+        db.close()
+
+
+def list_groups() -> List[Dict]:
+    from sqlalchemy import func
+
+    db = get_session()
+    try:
+        rows = (
+            db.query(RecipientGroup.name, func.count(GroupMember.id))
+            .outerjoin(GroupMember, GroupMember.group_id == RecipientGroup.id)
+            .group_by(RecipientGroup.id)
+            .order_by(RecipientGroup.name)
+            .all()
+        )
+        return [{"name": name, "members": count} for name, count in rows]
+    finally:
+        db.close()
+
+
+def start_broadcast(name: str, message: str, priority: int = DEFAULT_PRIORITY,
+                    api_key_id: Optional[int] = None) -> Optional[Dict]:
+    """
+    Fan a message out to every member of a group through the priority
+    dispatcher. Returns immediately with the parent Broadcast id; a
+    background thread records per-member outcomes when the sends finish.
+    Returns None when the group does not exist.
+    """
+    members = group_index.members(name)
+    if members is None:
+        return None
+
+    db = get_session()
+    fields = body_fields(db, message)
+    broadcast = Broadcast(group_name=name, **fields, priority=priority, api_key_id=api_key_id,
+                          total=len(members), status='sending' if members else 'done')
+    db.add(broadcast)
+    db.commit()
+    broadcast_id = broadcast.id
+    db.close()
+
+    if members:
+        # Batch-capable channels (email) go out as one provider call per channel
+        batched = {
+            channel: dispatch_many(channel, [r for c, r in members if c == channel], message, priority)
+            for channel in BATCH_CHANNELS
+            if any(c == channel for c, _ in members)
+        }
+        futures = [
+            batched[channel][recipient] if channel in batched else dispatch(channel, recipient, message, priority)
+            for channel, recipient in members
+        ]
+        threading.Thread(
+            target=_record_broadcast,
+            args=(broadcast_id, members, futures, message, fields, priority, api_key_id),
+            name=f"broadcast-{broadcast_id}",
+            daemon=True
+        ).start()
+
+    return {"broadcast_id": broadcast_id, "group": name, "recipients": len(members)}
+
+
+def _record_broadcast(broadcast_id: int, members, futures, message: str, fields: Dict[str, str],
+                      priority: int, api_key_id: Optional[int] = None):
+    try:
+        _finish_broadcast(broadcast_id, members, futures, message, fields, priority, api_key_id)
+    except Exception:
+        logger.exception("Recording broadcast %s failed", broadcast_id)
+        _mark_broadcast_failed(broadcast_id)
+
+
+def _mark_broadcast_failed(broadcast_id: int):
+    """Don't leave a broadcast 'sending' forever when recording its outcomes failed."""
+    db = get_session()
+    try:
+        db.query(Broadcast).filter_by(id=broadcast_id, status='sending').update(
+            {"status": 'failed', "completed_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+    except Exception:
+        logger.exception("Could not mark broadcast %s failed", broadcast_id)
+    finally:
+        db.close()
+
+
+def _finish_broadcast(broadcast_id: int, members, futures, message: str, fields: Dict[str, str],
+                      priority: int, api_key_id: Optional[int]):
+    from app.queue import add_many_to_retry_queue
+
+    outcomes = []
+    sent = failed = 0
+    for (channel, recipient), future in zip(members, futures):
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.exception("Broadcast %s send to %s failed", broadcast_id, recipient)
+            result = {"status": "failed", "details": str(e)}
+
+        if result['status'] == 'sent':
+            sent += 1
+        else:
+            failed += 1
+        outcomes.append((channel, recipient, result))
+
+    # Open the transaction only once every send has finished
+    db = get_session()
+    try:
+        # The body was stored with the Broadcast row; its logs share the hash
+        logs = [
+            MessageLog(
+                channel=channel,
+                recipient=recipient,
+                **fields,
+                status=result['status'],
+                details=result.get('details', ''),
+                priority=priority,
+                broadcast_id=broadcast_id,
+                api_key_id=api_key_id
+            )
+            for channel, recipient, result in outcomes
+        ]
+        db.add_all(logs)
+        db.flush()
+
+        # Retries and dead letters join the log rows' transaction
+        retry = []
+        receipts = []
+        for (channel, recipient, result), log in zip(outcomes, logs):
+            receipt = {"message_id": log.id, "broadcast_id": broadcast_id, "channel": channel, "recipient": recipient}
+            failure = {"error_class": result.get('error_class'), "details": result.get('details')}
+            if result['status'] == 'sent':
+                receipts.append(('sent', receipt))
+            elif is_retryable(result):
+                retry.append((channel, recipient, log.id))
+                receipts.append(('retrying', dict(receipt, attempts=0, **failure)))
+            else:
+                dead_letter_failure(db, channel, recipient, fields, priority, result,
+                                    api_key_id=api_key_id, message_log_id=log.id)
+                receipts.append(('dead_lettered', dict(receipt, attempts=1, **failure)))
+        next_retries = add_many_to_retry_queue([(c, r) for c, r, _ in retry], message, priority,
+                                               api_key_id=api_key_id, log_ids=[i for _, _, i in retry], db=db)
+        retrying = iter(next_retries)
+        for event, payload in receipts:
+            if event == 'retrying':
+                payload['next_retry'] = next(retrying).isoformat()
+
+        broadcast = db.get(Broadcast, broadcast_id)
+        broadcast.sent = sent
+        broadcast.failed = failed
+        broadcast.status = 'done'
+        broadcast.completed_at = datetime.utcnow()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    for event, payload in receipts:
+        emit(api_key_id, event, **payload)
+    logger.info("Broadcast %s finished: %s sent, %s failed", broadcast_id, sent, failed)
+
+
+def broadcast_status(broadcast_id: int, api_key_id: Optional[int] = None) -> Optional[Dict]:
+    """Progress of a broadcast, or None if it does not exist or belongs to another key."""
+    db = get_session()
+    try:
+        b = db.get(Broadcast, broadcast_id)
+        if not b or b.api_key_id != api_key_id:
+            return None
+        return {
+            "broadcast_id": b.id,
+            "group": b.group_name,
+            "status": b.status,
+            "total": b.total,
+            "sent": b.sent,
+            "failed": b.failed,
+            "created_at": b.created_at.isoformat() if b.created_at else None,
+            "completed_at": b.completed_at.isoformat() if b.completed_at else None,
+        }
+    finally:
+        db.close()
@@ -1,5 +1,22 @@
-from .email_handler import send_email
-from .telegram_handler import send_telegram, setup_telegram_bot
-from .facebook_handler import send_facebook, handle_messenger_event
+import importlib
+
+# Handler modules are imported on first use so workers don't pay for the
+# python-telegram-bot import (and friends) until a channel is actually hit.
+_exports = {
+    'send_email': 'email_handler',
+    'send_telegram': 'telegram_handler',
+    'setup_telegram_bot': 'telegram_handler',
+    'send_facebook': 'facebook_handler',
+    'handle_messenger_event': 'facebook_handler',
+}
 
 __all__ = ['send_email', 'send_telegram', 'send_facebook', 'setup_telegram_bot', 'handle_messenger_event']
+
+
+def __getattr__(name):
+    module_name = _exports.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
@@ -2,7 +2,14 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
+from typing import Dict, List, Union
 from app.utils import load_env_encrypted
+from app.handlers import errors
+
+# Most relays cap RCPT TO per transaction (often 50-100); larger lists are
+# split into several transactions on the same connection.
+SMTP_MAX_RECIPIENTS = int(os.getenv('SMTP_MAX_RECIPIENTS', '50'))
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '30'))
 
 def get_html_template(message: str) -> str:
     return f"""
@@ -55,27 +62,99 @@ def get_html_template(message: str) -> str:
     </html>
     """
 
-def send_email(recipient: str, message: str, subject: str = "AlertBot Notification") -> dict:
+def _classify_smtp_error(e: Exception) -> dict:
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in e.recipients.values()]
+        if codes and all(code >= 500 for code in codes):
+            return errors.failed(str(e), errors.INVALID_RECIPIENT, retryable=False)
+        return errors.failed(str(e), errors.PROVIDER)
+    if isinstance(e, (smtplib.SMTPAuthenticationError, smtplib.SMTPSenderRefused)):
+        return errors.failed(str(e), errors.CONFIG)
+    if isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return errors.failed(str(e), errors.NETWORK)
+    if isinstance(e, smtplib.SMTPResponseException):
+        # 5xx on MAIL/DATA rejects this message; 4xx is a temporary condition
+        if e.smtp_code >= 500:
+            return errors.failed(str(e), errors.REJECTED, retryable=False)
+        return errors.failed(str(e), errors.PROVIDER)
+    if isinstance(e, OSError):
+        return errors.failed(str(e), errors.NETWORK)
+    return errors.failed(str(e))
+
+def _refused_result(code: int, response) -> dict:
+    """Result for one address the relay refused at RCPT TO."""
+    if isinstance(response, bytes):
+        response = response.decode('utf-8', 'replace')
+    details = f"{code} {response}"
+    if code >= 500:
+        return errors.failed(details, errors.INVALID_RECIPIENT, retryable=False)
+    return errors.failed(details, errors.PROVIDER)
+
+def render_email(message: str, subject: str, sender: str, to_header: str) -> bytes:
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = to_header
+    
+    html_content = get_html_template(message)
+    msg.attach(MIMEText(message, 'plain'))
+    msg.attach(MIMEText(html_content, 'html'))
+    return msg.as_bytes()
+
+def _send_to_many(recipients: List[str], message: str, subject: str) -> Dict[str, dict]:
+    """
+    Render the message once and deliver it over one SMTP connection, with up
+    to SMTP_MAX_RECIPIENTS envelope recipients per transaction. Returns a
+    result per recipient.
+    """
+    results = {}
     try:
         smtp_server = load_env_encrypted('SMTP_SERVER', 'smtp.gmail.com')
         smtp_port = int(load_env_encrypted('SMTP_PORT', '587'))
         smtp_user = load_env_encrypted('SMTP_USERNAME', '')
         smtp_pass = load_env_encrypted('SMTP_PASSWORD', '')
         
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = smtp_user
-        msg['To'] = recipient
+        # Recipients of a shared copy must not see each other's addresses
+        to_header = recipients[0] if len(recipients) == 1 else 'undisclosed-recipients:;'
+        data = render_email(message, subject, smtp_user, to_header)
         
-        html_content = get_html_template(message)
-        msg.attach(MIMEText(message, 'plain'))
-        msg.attach(MIMEText(html_content, 'html'))
-        
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
+        with smtplib.SMTP(smtp_server, smtp_port, timeout=SMTP_TIMEOUT) as server:
             server.starttls()
             server.login(smtp_user, smtp_pass)
-            server.send_message(msg)
-        
-        return {"status": "sent", "details": "Email sent successfully"}
+            for i in range(0, len(recipients), SMTP_MAX_RECIPIENTS):
+                chunk = recipients[i:i + SMTP_MAX_RECIPIENTS]
+                try:
+                    refused = server.sendmail(smtp_user, chunk, data)
+                except smtplib.SMTPRecipientsRefused as e:
+                    refused = e.recipients
+                except smtplib.SMTPResponseException as e:
+                    # MAIL FROM / DATA rejected: applies to the whole chunk
+                    failure = _classify_smtp_error(e)
+                    results.update((r, failure) for r in chunk)
+                    continue
+                for r in chunk:
+                    results[r] = _refused_result(*refused[r]) if r in refused else errors.sent("Email sent successfully")
     except Exception as e:
-        return {"status": "failed", "details": str(e)}
+        # Connection-level failure: everything not yet attempted shares it
+        failure = _classify_smtp_error(e)
+        for r in recipients:
+            results.setdefault(r, failure)
+    return results
+
+def send_email(recipient: Union[str, List[str]], message: str, subject: str = "AlertBot Notification") -> dict:
+    """
+    Send to one address, or to a list of addresses in as few SMTP
+    transactions as the relay allows. For a list the result also carries
+    `results`, mapping each address to its own sent/failed result.
+    """
+    if isinstance(recipient, str):
+        return _send_to_many([recipient], message, subject)[recipient]
+    
+    recipients = list(dict.fromkeys(recipient))
+    results = _send_to_many(recipients, message, subject) if recipients else {}
+    accepted = sum(1 for r in results.values() if r['status'] == 'sent')
+    return {
+        "status": "sent" if accepted == len(results) else "failed",
+        "details": f"{accepted}/{len(results)} recipients accepted",
+        "results": results,
+    }
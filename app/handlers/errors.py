@@ -0,0 +1,34 @@
+from typing import Any, Dict, Optional
+
+# Error classes reported in failed handler results. Only the recipient-level
+# ones are permanent for that address; everything else may clear up later.
+NETWORK = 'network'
+RATE_LIMITED = 'rate_limited'
+PROVIDER = 'provider'
+CONFIG = 'config'
+INVALID_RECIPIENT = 'invalid_recipient'
+BLOCKED = 'blocked'
+REJECTED = 'rejected'
+# Our own per-channel executor was full; the provider was never contacted
+OVERLOADED = 'overloaded'
+
+# Failures that say the recipient itself is unreachable, so later sends to
+# the same address can fail fast.
+RECIPIENT_ERRORS = (INVALID_RECIPIENT, BLOCKED)
+
+
+def sent(details: str) -> Dict[str, Any]:
+    return {"status": "sent", "details": details}
+
+
+def failed(details: str, error_class: str = PROVIDER, retryable: bool = True,
+           retry_after: Optional[float] = None) -> Dict[str, Any]:
+    result = {"status": "failed", "details": details, "error_class": error_class, "retryable": retryable}
+    if retry_after:
+        result["retry_after"] = retry_after
+    return result
+
+
+def is_retryable(result: Optional[Dict[str, Any]]) -> bool:
+    """Results without classification (older callers) are treated as transient."""
+    return result is None or result.get('retryable', True)
@@ -7,6 +7,7 @@ from typing import Any, Dict, Optional
 import requests
 
 from app.utils import load_env_encrypted
+from app.handlers import errors
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +17,7 @@ __all__ = [
     "handle_messenger_event",
     "facebook_startup_check",
     "start_facebook_monitor",
+    "run_facebook_monitor",
     "subscribe_page_if_configured",
 ]
 
@@ -39,7 +41,7 @@ def send_facebook(recipient: str, message: str) -> Dict[str, Any]:
     try:
         token = load_env_encrypted('FACEBOOK_PAGE_TOKEN', '')
         if not token:
-            return {"status": "failed", "details": "FACEBOOK_PAGE_TOKEN not set"}
+            return errors.failed("FACEBOOK_PAGE_TOKEN not set", errors.CONFIG)
 
         url = f"https://graph.facebook.com/v22.0/me/messages"
 
@@ -58,13 +60,48 @@ def send_facebook(recipient: str, message: str) -> Dict[str, Any]:
         )
 
         if response.status_code in (200, 201):
-            return {"status": "sent", "details": "Facebook message sent successfully"}
+            return errors.sent("Facebook message sent successfully")
         else:
             # Surface Graph API error text for debugging
-            return {"status": "failed", "details": response.text}
+            return _classify_graph_error(response)
+    except requests.RequestException as e:
+        logger.warning("send_facebook network error: %s", e)
+        return errors.failed(str(e), errors.NETWORK)
     except Exception as e:
         logger.exception("send_facebook error")
-        return {"status": "failed", "details": str(e)}
+        return errors.failed(str(e))
+
+
+# Graph API error codes, see the Messenger Platform error reference
+_GRAPH_RATE_LIMIT_CODES = {4, 17, 32, 613}
+_GRAPH_TRANSIENT_CODES = {1, 2}
+_GRAPH_CONFIG_CODES = {190, 200}
+_GRAPH_NO_USER_SUBCODES = {2018001}
+_GRAPH_UNAVAILABLE_CODES = {551}
+
+
+def _classify_graph_error(response) -> Dict[str, Any]:
+    try:
+        err = response.json().get('error', {})
+    except ValueError:
+        err = {}
+    code = err.get('code')
+    subcode = err.get('error_subcode')
+
+    if response.status_code >= 500 or code in _GRAPH_TRANSIENT_CODES:
+        return errors.failed(response.text, errors.PROVIDER)
+    if code in _GRAPH_RATE_LIMIT_CODES:
+        return errors.failed(response.text, errors.RATE_LIMITED)
+    if code in _GRAPH_CONFIG_CODES:
+        return errors.failed(response.text, errors.CONFIG)
+    if subcode in _GRAPH_NO_USER_SUBCODES:
+        return errors.failed(response.text, errors.INVALID_RECIPIENT, retryable=False)
+    if code in _GRAPH_UNAVAILABLE_CODES:
+        return errors.failed(response.text, errors.BLOCKED, retryable=False)
+    if code is not None and response.status_code < 500:
+        # Remaining 4xx errors (policy window, bad payload) won't change on retry
+        return errors.failed(response.text, errors.REJECTED, retryable=False)
+    return errors.failed(response.text, errors.PROVIDER)
 
 
 def handle_messenger_event(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -210,6 +247,11 @@ def _facebook_monitor_loop(interval_seconds: int = 600):
             pass
 
 
+def run_facebook_monitor(interval_seconds: int = 600):
+    """Run the monitor loop in the calling thread; blocks forever (leader-election target)."""
+    _facebook_monitor_loop(interval_seconds)
+
+
 def start_facebook_monitor(interval_seconds: int = 600) -> threading.Thread:
     """
     Start the background monitor in a daemon thread. The monitor performs an
@@ -1,11 +1,22 @@
 import threading
 import asyncio
+import hashlib
+import hmac
+import os
+import logging
 from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler
+from telegram.error import BadRequest, Forbidden, InvalidToken, NetworkError, RetryAfter
 from app.utils import load_env_encrypted
+from app.handlers import errors
+
+logger = logging.getLogger(__name__)
 
 bot_app = None
 
+# Event loop that drives the Application in webhook mode (one per worker)
+_webhook_loop = None
+
 async def start_command(update: Update, context):
     keyboard = [
         [InlineKeyboardButton("Get My ID", callback_data='getid')],
@@ -122,6 +133,112 @@ def start_telegram_polling(app: Application):
         except:
             pass
 
+def get_telegram_mode() -> str:
+    """
+    Return 'webhook' or 'polling'. TELEGRAM_MODE wins when set explicitly;
+    otherwise webhook mode is used whenever TELEGRAM_WEBHOOK_URL is configured.
+    """
+    mode = os.getenv('TELEGRAM_MODE', '').strip().lower()
+    if mode in ('webhook', 'polling'):
+        return mode
+    return 'webhook' if os.getenv('TELEGRAM_WEBHOOK_URL') else 'polling'
+
+
+def get_webhook_secret() -> str:
+    """
+    Secret token Telegram echoes back in X-Telegram-Bot-Api-Secret-Token.
+    Falls back to a value derived from SECRET_KEY and the bot token so every
+    worker agrees on it without extra configuration.
+    """
+    secret = load_env_encrypted('TELEGRAM_WEBHOOK_SECRET', '')
+    if secret:
+        return secret
+    seed = os.getenv('SECRET_KEY', 'dev-secret-key') + load_env_encrypted('TELEGRAM_BOT_TOKEN', '')
+    return hashlib.sha256(seed.encode()).hexdigest()
+
+
+def verify_webhook_secret(received: str) -> bool:
+    return bool(received) and hmac.compare_digest(received, get_webhook_secret())
+
+
+def _run_webhook_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def start_telegram_webhook(app: Application) -> bool:
+    """
+    Initialize the Application on a dedicated event loop thread so webhook
+    updates can be handed to it from Flask request threads. Does not poll.
+    Returns True once the Application is ready to process updates.
+    """
+    global _webhook_loop
+    if _webhook_loop is not None:
+        return True
+
+    loop = asyncio.new_event_loop()
+    t = threading.Thread(target=_run_webhook_loop, args=(loop,), daemon=True)
+    t.start()
+    try:
+        asyncio.run_coroutine_threadsafe(app.initialize(), loop).result(timeout=30)
+        asyncio.run_coroutine_threadsafe(app.start(), loop).result(timeout=30)
+    except Exception:
+        logger.exception("Failed to start Telegram application for webhook mode")
+        loop.call_soon_threadsafe(loop.stop)
+        return False
+
+    _webhook_loop = loop
+    return True
+
+
+def register_telegram_webhook(app: Application, url: str = None) -> dict:
+    """
+    Point the bot at our webhook route. Idempotent on Telegram's side, so it
+    is safe to call on every boot; pending updates are kept so nothing that
+    arrived during a deploy or failover is lost. Returns a dict with keys:
+    ok and details.
+    """
+    url = url or os.getenv('TELEGRAM_WEBHOOK_URL', '')
+    if not url:
+        return {"ok": False, "details": "TELEGRAM_WEBHOOK_URL not set"}
+    if _webhook_loop is None:
+        return {"ok": False, "details": "Telegram application not started"}
+
+    try:
+        future = asyncio.run_coroutine_threadsafe(app.bot.set_webhook(
+            url=url,
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=get_webhook_secret()
+        ), _webhook_loop)
+        future.result(timeout=15)
+        return {"ok": True, "details": f"webhook set to {url}"}
+    except Exception as e:
+        logger.exception("register_telegram_webhook failed")
+        return {"ok": False, "details": str(e)}
+
+
+def process_webhook_update(data: dict) -> bool:
+    """
+    Feed a raw update payload from the webhook route to the Application.
+    Processing happens on the webhook loop; the request thread does not wait.
+    Returns False when webhook mode is not running in this worker.
+    """
+    if bot_app is None or _webhook_loop is None:
+        return False
+    update = Update.de_json(data, bot_app.bot)
+    future = asyncio.run_coroutine_threadsafe(bot_app.process_update(update), _webhook_loop)
+    future.add_done_callback(_log_update_failure)
+    return True
+
+
+def _log_update_failure(future):
+    if future.cancelled():
+        return
+    exc = future.exception()
+    if exc is not None:
+        logger.error("Telegram webhook update failed: %s", exc)
+
+
 def start_telegram_in_thread():
     """
     Convenience: build the Application and start polling in a daemon thread.
@@ -147,9 +264,26 @@ async def send_telegram_async(recipient: str, message: str) -> dict:
         )
         bot = Bot(token=load_env_encrypted('TELEGRAM_BOT_TOKEN', ''))
         await bot.send_message(chat_id=recipient, text=formatted_message)
-        return {"status": "sent", "details": "Telegram message sent successfully"}
+        return errors.sent("Telegram message sent successfully")
     except Exception as e:
-        return {"status": "failed", "details": str(e)}
+        return _classify_telegram_error(e)
+
+def _classify_telegram_error(e: Exception) -> dict:
+    if isinstance(e, RetryAfter):
+        return errors.failed(str(e), errors.RATE_LIMITED, retry_after=e.retry_after)
+    if isinstance(e, InvalidToken):
+        return errors.failed(str(e), errors.CONFIG)
+    if isinstance(e, Forbidden):
+        # Bot blocked by the user, or the user never started the bot
+        return errors.failed(str(e), errors.BLOCKED, retryable=False)
+    if isinstance(e, BadRequest):
+        text = str(e).lower()
+        if 'chat not found' in text or 'user not found' in text or 'chat_id is empty' in text:
+            return errors.failed(str(e), errors.INVALID_RECIPIENT, retryable=False)
+        return errors.failed(str(e), errors.REJECTED, retryable=False)
+    if isinstance(e, (NetworkError, OSError)):
+        return errors.failed(str(e), errors.NETWORK)
+    return errors.failed(str(e))
 
 def send_telegram(recipient: str, message: str) -> dict:
     try:
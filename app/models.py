@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text, inspect
+from sqlalchemy import create_engine, event, Column, Integer, Float, String, DateTime, Boolean, Text, LargeBinary, ForeignKey, UniqueConstraint, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 from datetime import datetime
@@ -9,7 +9,50 @@ Base = declarative_base()
 
 # Engine & session setup
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///alertbot.db')
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if 'sqlite' in DATABASE_URL else {})
+
+# Connection pool per engine (per worker process). pre_ping replaces
+# connections the server dropped instead of failing the next query.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url.startswith('sqlite') and (':memory:' in url or url.rstrip('/') in ('sqlite:', 'sqlite:/'))
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers and one writer work concurrently; busy_timeout makes
+    # a blocked writer wait for the lock instead of raising "database is locked".
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def _create_engine(url: str):
+    options = {}
+    if url.startswith('sqlite'):
+        options["connect_args"] = {"check_same_thread": False}
+    if not _is_memory_sqlite(url):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    new_engine = create_engine(url, **options)
+    if new_engine.dialect.name == 'sqlite':
+        event.listen(new_engine, 'connect', _set_sqlite_pragmas)
+    return new_engine
+
+
+engine = _create_engine(DATABASE_URL)
+_engines = {DATABASE_URL: engine}
 SessionLocal = scoped_session(sessionmaker(bind=engine))
 
 # ---------------------------
@@ -22,6 +65,12 @@ class APIKey(Base):
     key = Column(String(100), unique=True, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    # Per-key quotas; NULL falls back to config.json rate_limit defaults
+    rate_limit_per_minute = Column(Integer)
+    rate_limit_per_hour = Column(Integer)
+    # Delivery receipts are POSTed here, signed with callback_secret
+    callback_url = Column(String(500))
+    callback_secret = Column(String(100))
 
 
 class MessageLog(Base):
@@ -34,6 +83,15 @@ class MessageLog(Base):
     details = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     retry_count = Column(Integer, default=0)
+    priority = Column(Integer, default=2)
+    broadcast_id = Column(Integer, index=True)
+    # When set, `message` is empty and the text lives in message_bodies
+    body_hash = Column(String(64), index=True)
+    api_key_id = Column(Integer, index=True)
+
+    @property
+    def message_text(self) -> str:
+        return _resolve_message(self)
 
 
 class RetryQueue(Base):
@@ -45,6 +103,119 @@ class RetryQueue(Base):
     attempts = Column(Integer, default=0)
     next_retry = Column(DateTime, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    priority = Column(Integer, default=2)
+    body_hash = Column(String(64))
+    # JSON list of {"at", "error_class", "details"}, one entry per failed attempt
+    failure_history = Column(Text)
+    api_key_id = Column(Integer)
+    # The MessageLog row of the original send, reported in delivery receipts
+    message_log_id = Column(Integer)
+
+    @property
+    def message_text(self) -> str:
+        return _resolve_message(self)
+
+
+class DeadLetter(Base):
+    """A retry-queue item that was given up on, kept for inspection and replay."""
+    __tablename__ = 'dead_letters'
+    id = Column(Integer, primary_key=True)
+    channel = Column(String(20), nullable=False, index=True)
+    recipient = Column(String(200), nullable=False)
+    message = Column(Text, nullable=False)
+    body_hash = Column(String(64))
+    priority = Column(Integer, default=2)
+    attempts = Column(Integer, default=0)
+    # 'exhausted' (hit max_attempts) or 'permanent' (non-retryable failure)
+    reason = Column(String(20), nullable=False)
+    last_error_class = Column(String(30))
+    failure_history = Column(Text)
+    # 'dead', 'queued' for replay, or 'sending' while a replay worker holds it
+    status = Column(String(20), nullable=False, default='dead', index=True)
+    claimed_by = Column(String(64))
+    claimed_at = Column(DateTime)
+    replay_job_id = Column(Integer, index=True)
+    replay_count = Column(Integer, default=0)
+    api_key_id = Column(Integer)
+    message_log_id = Column(Integer)
+    first_queued_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    @property
+    def message_text(self) -> str:
+        return _resolve_message(self)
+
+
+class ReplayJob(Base):
+    """One admin replay request. Its rate and concurrency are what the leader's replay worker uses."""
+    __tablename__ = 'replay_jobs'
+    id = Column(Integer, primary_key=True)
+    rate = Column(Float, nullable=False)
+    concurrency = Column(Integer, nullable=False)
+    queued = Column(Integer, default=0)
+    # 'active' until its letters are all replayed ('done') or it is 'cancelled'
+    status = Column(String(20), nullable=False, default='active', index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+
+class MessageBody(Base):
+    """Message text stored once per distinct content, zlib-compressed when large."""
+    __tablename__ = 'message_bodies'
+    hash = Column(String(64), primary_key=True)
+    body = Column(LargeBinary, nullable=False)
+    compressed = Column(Boolean, default=False, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+def _resolve_message(row) -> str:
+    if row.body_hash:
+        from app.bodies import load_body
+        text = load_body(row.body_hash)
+        if text is not None:
+            return text
+    return row.message
+
+
+class RecipientGroup(Base):
+    __tablename__ = 'recipient_groups'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), unique=True, nullable=False)
+    # Bumped on every membership change so cached member lists can be validated cheaply
+    version = Column(Integer, default=1, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class GroupMember(Base):
+    __tablename__ = 'group_members'
+    __table_args__ = (UniqueConstraint('group_id', 'channel', 'recipient'),)
+    id = Column(Integer, primary_key=True)
+    group_id = Column(Integer, ForeignKey('recipient_groups.id', ondelete='CASCADE'), nullable=False, index=True)
+    channel = Column(String(20), nullable=False)
+    recipient = Column(String(200), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Broadcast(Base):
+    __tablename__ = 'broadcasts'
+    id = Column(Integer, primary_key=True)
+    group_name = Column(String(100), nullable=False)
+    message = Column(Text, nullable=False)
+    body_hash = Column(String(64))
+    priority = Column(Integer, default=2)
+    status = Column(String(20), nullable=False, default='sending')
+    total = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    # Key that started the broadcast; only it can read the status
+    api_key_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+    @property
+    def message_text(self) -> str:
+        return _resolve_message(self)
 
 # ---------------------------
 # Database Utility Functions
@@ -60,18 +231,19 @@ def init_db():
 
 def get_engine(db_url: str | None = None):
     """
-    Return an engine for the given db_url. If db_url is None or matches the
-    module DATABASE_URL, return the module-level engine.
+    Return the pooled engine for db_url, creating it on first use. None or
+    the module DATABASE_URL gives the module-level engine.
     """
-    if db_url is None or db_url == DATABASE_URL:
-        return engine
-    connect_args = {"check_same_thread": False} if 'sqlite' in db_url else {}
-    return create_engine(db_url, connect_args=connect_args)
+    url = db_url or DATABASE_URL
+    if url not in _engines:
+        _engines[url] = _create_engine(url)
+    return _engines[url]
 
 
 def get_session(engine_arg=None):
     """Get a session. If engine_arg is provided, return a session bound to it,
-    otherwise return the module-scoped SessionLocal().
+    otherwise return the module-scoped SessionLocal(). Inside a request this
+    is the request's session; it is removed when the app context tears down.
     """
     if engine_arg is None:
         return SessionLocal()
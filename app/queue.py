@@ -1,72 +1,209 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from app.models import get_session, RetryQueue
-from app.handlers import send_email, send_telegram, send_facebook
-from app.utils import report_error
+from app.breaker import CHANNELS, get_breaker
+from app.dispatcher import dispatch, get_dispatcher, DEFAULT_PRIORITY
+from app.handlers.errors import is_retryable
+from app.bodies import body_fields, prefetch_bodies
+from app.tracing import start_trace, finish_trace, span
+from app.deadletter import append_failure, dead_letter, resume_replay
+from app.callbacks import emit
+from app.utils import report_error, load_config, config_section
+from sqlalchemy import or_
 from datetime import datetime, timedelta
-import json
+import time
+import random
+import logging
+
+logger = logging.getLogger(__name__)
 
 scheduler = BackgroundScheduler()
 
-def add_to_retry_queue(channel: str, recipient: str, message: str):
-    db = get_session()
+def jittered_delay(delay: float) -> float:
+    """Spread retries over [delay/2, delay] so failures don't retry in lockstep."""
+    return random.uniform(delay / 2, delay)
+
+def add_to_retry_queue(channel: str, recipient: str, message: str, priority: int = DEFAULT_PRIORITY,
+                       api_key_id: int = None, message_log_id: int = None, db=None):
+    """
+    Queue one message and return when its first retry is due. Pass `db` to
+    join the caller's transaction; it then commits.
+    """
+    own_session = db is None
+    if own_session:
+        db = get_session()
     
-    with open('config.json', 'r') as f:
-        config = json.load(f)
+    config = load_config()
     
     retry_item = RetryQueue(
         channel=channel,
         recipient=recipient,
-        message=message,
+        **body_fields(db, message),
         attempts=0,
-        next_retry=datetime.utcnow() + timedelta(seconds=config['retry']['base_delay'])
+        next_retry=datetime.utcnow() + timedelta(seconds=jittered_delay(config['retry']['base_delay'])),
+        priority=priority,
+        api_key_id=api_key_id,
+        message_log_id=message_log_id
     )
     db.add(retry_item)
-    db.commit()
-    db.close()
+    next_retry = retry_item.next_retry
+    if own_session:
+        db.commit()
+        db.close()
+    return next_retry
+
+def add_many_to_retry_queue(recipients: list, message: str, priority: int = DEFAULT_PRIORITY,
+                            api_key_id: int = None, log_ids: list = None, db=None):
+    """
+    Queue one message for several (channel, recipient) pairs in a single commit.
+    `log_ids`, when given, lines up with `recipients`. Pass `db` to join the
+    caller's transaction instead. Returns each entry's first retry time, in order.
+    """
+    if not recipients:
+        return []
+    own_session = db is None
+    if own_session:
+        db = get_session()
+    
+    config = load_config()
+    
+    base_delay = config['retry']['base_delay']
+    fields = body_fields(db, message)
+    items = [
+        RetryQueue(
+            channel=channel,
+            recipient=recipient,
+            **fields,
+            attempts=0,
+            next_retry=datetime.utcnow() + timedelta(seconds=jittered_delay(base_delay)),
+            priority=priority,
+            api_key_id=api_key_id,
+            message_log_id=log_id
+        )
+        for (channel, recipient), log_id in zip(recipients, log_ids or [None] * len(recipients))
+    ]
+    db.add_all(items)
+    next_retries = [item.next_retry for item in items]
+    if own_session:
+        db.commit()
+        db.close()
+    return next_retries
 
 def process_retry_queue():
+    token = start_trace('process_retry_queue')
+    try:
+        _process_due_items()
+    finally:
+        finish_trace(token)
+
+def _process_due_items():
     db = get_session()
     
-    with open('config.json', 'r') as f:
-        config = json.load(f)
+    config = load_config()
     
     max_attempts = config['retry']['max_attempts']
     base_delay = config['retry']['base_delay']
     max_delay = config['retry']['max_delay']
     
-    items = db.query(RetryQueue).filter(
-        RetryQueue.next_retry <= datetime.utcnow(),
-        RetryQueue.attempts < max_attempts
-    ).all()
+    with span('db_query'):
+        items = _due_items(db, max_attempts)
+        prefetch_bodies(item.body_hash for item in items)
     
+    # Fan the sends out through the priority lanes, then apply the outcomes
+    # here since the session must stay on this thread.
+    pending = []
+    receipts = []
     for item in items:
-        result = None
-        
-        if item.channel == 'email':
-            result = send_email(item.recipient, item.message)
-        elif item.channel == 'telegram':
-            result = send_telegram(item.recipient, item.message)
-        elif item.channel == 'facebook':
-            result = send_facebook(item.recipient, item.message)
+        if item.channel not in CHANNELS:
+            pending.append((item, None))
+            continue
+        pending.append((item, dispatch(item.channel, item.recipient, item.message_text, item.priority or DEFAULT_PRIORITY)))
+    
+    for item, future in pending:
+        with span('item', item_id=item.id, channel=item.channel):
+            result = future.result() if future else None
+        # Circuit open or bulkhead full: the provider wasn't tried, so this isn't an attempt
+        if result and (result.get('circuit_open') or result.get('bulkhead_full')):
+            continue
         
+        receipt = {"message_id": item.message_log_id, "channel": item.channel, "recipient": item.recipient}
+        failure = {"error_class": (result or {}).get('error_class'), "details": (result or {}).get('details')}
         if result and result['status'] == 'sent':
+            receipts.append((item.api_key_id, 'sent', dict(receipt, attempts=item.attempts + 1)))
+            db.delete(item)
+        elif not is_retryable(result):
+            logger.warning(
+                f"Dead-lettering {item.channel} message to {item.recipient}: "
+                f"permanent failure ({result.get('error_class')}): {result.get('details')}"
+            )
+            item.attempts += 1
+            item.failure_history = append_failure(item.failure_history, result)
+            dead_letter(db, item, 'permanent')
+            receipts.append((item.api_key_id, 'dead_lettered', dict(receipt, attempts=item.attempts, **failure)))
             db.delete(item)
         else:
             item.attempts += 1
-            delay = min(base_delay * (2 ** item.attempts), max_delay)
+            item.failure_history = append_failure(item.failure_history, result)
+            delay = jittered_delay(min(base_delay * (2 ** item.attempts), max_delay))
+            if result and result.get('retry_after'):
+                delay = max(delay, result['retry_after'])
             item.next_retry = datetime.utcnow() + timedelta(seconds=delay)
             
             if item.attempts >= max_attempts:
-                report_error(
-                    f"Failed to send {item.channel} message to {item.recipient} "
-                    f"after {max_attempts} attempts. Message: {item.message[:50]}..."
-                )
+                with span('report_error', item_id=item.id):
+                    report_error(
+                        f"Failed to send {item.channel} message to {item.recipient} "
+                        f"after {max_attempts} attempts. Message: {item.message_text[:50]}..."
+                    )
+                dead_letter(db, item, 'exhausted')
+                receipts.append((item.api_key_id, 'dead_lettered', dict(receipt, attempts=item.attempts, **failure)))
                 db.delete(item)
+            else:
+                receipts.append((item.api_key_id, 'retrying', dict(
+                    receipt, attempts=item.attempts, next_retry=item.next_retry.isoformat(), **failure)))
     
-    db.commit()
+    with span('db_commit'):
+        db.commit()
     db.close()
 
+    # Report outcomes only once they are durable
+    for api_key_id, event, fields in receipts:
+        emit(api_key_id, event, **fields)
+
+def _due_items(db, max_attempts: int):
+    """
+    Due retry items, at most as many per channel and priority lane as that
+    lane of the channel's bulkhead can queue right now, so a pass never
+    floods a lane and crowds out live sends.
+    """
+    due = db.query(RetryQueue).filter(
+        RetryQueue.next_retry <= datetime.utcnow(),
+        RetryQueue.attempts < max_attempts
+    )
+    items = due.filter(RetryQueue.channel.notin_(CHANNELS)).all()
+    for channel in CHANNELS:
+        # Leave items untouched while their provider's circuit is open
+        if get_breaker(channel).is_open():
+            continue
+        dispatcher = get_dispatcher(channel)
+        for priority in dispatcher.lanes:
+            free = dispatcher.free_slots(priority)
+            if free == 0:
+                continue
+            in_lane = RetryQueue.priority == priority
+            if priority == DEFAULT_PRIORITY:
+                in_lane = or_(in_lane, RetryQueue.priority.is_(None))
+            lane = due.filter(RetryQueue.channel == channel, in_lane).order_by(RetryQueue.next_retry)
+            items.extend(lane.limit(free).all() if free is not None else lane.all())
+    return items
+
 def start_scheduler():
     if not scheduler.running:
         scheduler.add_job(process_retry_queue, 'interval', seconds=30)
+        scheduler.add_job(resume_replay, 'interval', seconds=config_section('dead_letter').get('poll_interval', 5))
         scheduler.start()
+
+def run_scheduler():
+    """Leader target: start the scheduler and hold leadership for as long as it runs."""
+    start_scheduler()
+    while scheduler.running:
+        time.sleep(5)
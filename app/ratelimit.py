@@ -0,0 +1,263 @@
+import os
+import abc
+import math
+import time
+import sqlite3
+import tempfile
+import threading
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.config import config_section
+
+try:
+    import redis
+except ImportError:  # optional: only needed for redis:// storage
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 3600
+
+
+class RateLimitBackend(abc.ABC):
+    """
+    Storage for fixed-window counters. Implementations must be safe to share
+    between threads; sharing between processes is what makes limits exact
+    across gunicorn workers.
+    """
+
+    @abc.abstractmethod
+    def incr_and_get(self, incr: List[Tuple[str, float]], read: List[str]) -> Tuple[List[int], List[int]]:
+        """
+        In one atomic step, increment each (bucket, ttl_seconds) in `incr` by
+        one and read the buckets in `read`. Returns (the incremented counts,
+        the read counts), so concurrent callers never see the same count.
+        """
+
+    @abc.abstractmethod
+    def decr_many(self, buckets: List[str]) -> None:
+        """Undo one increment of each bucket (a request that was rejected)."""
+
+
+class MemoryBackend(RateLimitBackend):
+    """Per-process counters; only accurate with a single worker."""
+
+    def __init__(self):
+        self._counts: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, bucket: str, now: float) -> int:
+        count, expires = self._counts.get(bucket, (0, 0))
+        return count if expires > now else 0
+
+    def incr_and_get(self, incr, read):
+        now = time.time()
+        with self._lock:
+            counts = []
+            for bucket, ttl in incr:
+                count = self._get(bucket, now) + 1
+                self._counts[bucket] = (count, now + ttl)
+                counts.append(count)
+            read_counts = [self._get(bucket, now) for bucket in read]
+            if len(self._counts) > 10000:
+                self._counts = {b: v for b, v in self._counts.items() if v[1] > now}
+        return counts, read_counts
+
+    def decr_many(self, buckets):
+        with self._lock:
+            for bucket in buckets:
+                count, expires = self._counts.get(bucket, (0, 0))
+                if count > 0:
+                    self._counts[bucket] = (count - 1, expires)
+
+
+class SQLiteBackend(RateLimitBackend):
+    """
+    Counters in a small SQLite file shared by every worker on the host.
+    Each hit is one BEGIN IMMEDIATE transaction, so workers take turns.
+    """
+
+    _CLEANUP_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._ops = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_counters "
+            "(bucket TEXT PRIMARY KEY, count INTEGER NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _counts(self, conn: sqlite3.Connection, buckets: List[str], now: float) -> List[int]:
+        if not buckets:
+            return []
+        placeholders = ','.join('?' * len(buckets))
+        rows = conn.execute(
+            f"SELECT bucket, count FROM rate_counters WHERE bucket IN ({placeholders}) AND expires > ?",
+            (*buckets, now)
+        ).fetchall()
+        counts = dict(rows)
+        return [counts.get(b, 0) for b in buckets]
+
+    def incr_and_get(self, incr, read):
+        now = time.time()
+        conn = self._conn()
+        # Take the write lock before reading so no other worker can count in between
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO rate_counters (bucket, count, expires) VALUES (?, 1, ?) "
+                "ON CONFLICT(bucket) DO UPDATE SET count = count + 1",
+                [(bucket, now + ttl) for bucket, ttl in incr]
+            )
+            counts = self._counts(conn, [bucket for bucket, _ in incr], now)
+            read_counts = self._counts(conn, read, now)
+            self._ops += 1
+            if self._ops % self._CLEANUP_EVERY == 0:
+                conn.execute("DELETE FROM rate_counters WHERE expires <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return counts, read_counts
+
+    def decr_many(self, buckets):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "UPDATE rate_counters SET count = count - 1 WHERE bucket = ? AND count > 0",
+                [(bucket,) for bucket in buckets]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class RedisBackend(RateLimitBackend):
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("redis:// rate limit storage requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+
+    def incr_and_get(self, incr, read):
+        # MULTI/EXEC: the increments and the reads run as one transaction
+        pipe = self.client.pipeline(transaction=True)
+        for bucket, ttl in incr:
+            pipe.incr(bucket)
+            pipe.expire(bucket, int(math.ceil(ttl)))
+        if read:
+            pipe.mget(read)
+        replies = pipe.execute()
+        counts = [int(v) for v in replies[0:2 * len(incr):2]]
+        read_counts = [int(v or 0) for v in replies[-1]] if read else []
+        return counts, read_counts
+
+    def decr_many(self, buckets):
+        pipe = self.client.pipeline(transaction=True)
+        for bucket in buckets:
+            pipe.decr(bucket)
+        pipe.execute()
+
+
+def backend_from_uri(uri: str) -> RateLimitBackend:
+    if uri.startswith('memory://'):
+        return MemoryBackend()
+    if uri.startswith('sqlite:///'):
+        return SQLiteBackend(uri[len('sqlite:///'):])
+    if uri.startswith(('redis://', 'rediss://')):
+        return RedisBackend(uri)
+    raise ValueError(f"Unsupported RATE_LIMIT_STORAGE_URI: {uri}")
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window counter: the previous fixed window's count is weighted by
+    how much of it still overlaps the sliding window and added to the current
+    window's count. Two counters per window per key, no per-request log.
+    """
+
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+
+    def hit(self, key: str, limits: List[Tuple[int, int]]) -> Dict:
+        """
+        Count one request for `key` against each (limit, window_seconds) pair.
+        The request is counted first, in the same atomic step as the read, so
+        concurrent workers can never all pass the check before any of them
+        counts. If it turns out to be over a limit the count is given back,
+        so rejected requests are not counted. Returns a dict with allowed,
+        limit, remaining and reset (seconds) for the tightest window.
+        """
+        now = time.time()
+        current, previous = [], []
+        for limit, window in limits:
+            start = int(now // window) * window
+            current.append((f"rl:{key}:{window}:{start}", 2 * window))
+            previous.append(f"rl:{key}:{window}:{start - window}")
+        current_counts, previous_counts = self.backend.incr_and_get(current, previous)
+
+        allowed = True
+        tightest = None
+        for (limit, window), count, prev in zip(limits, current_counts, previous_counts):
+            elapsed = now % window
+            # `count` already includes this request
+            estimated = prev * (window - elapsed) / window + count
+            remaining = max(0, int(limit - estimated))
+            reset = int(math.ceil(window - elapsed))
+            if estimated > limit:
+                allowed = False
+                remaining = 0
+            if tightest is None or remaining < tightest["remaining"]:
+                tightest = {"limit": limit, "remaining": remaining, "reset": reset}
+
+        if not allowed:
+            self.backend.decr_many([bucket for bucket, _ in current])
+        return dict(tightest, allowed=allowed)
+
+
+_limiter: Optional[SlidingWindowLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_key_limiter() -> SlidingWindowLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            default_uri = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'alertbot-ratelimit.db')
+            uri = os.getenv('RATE_LIMIT_STORAGE_URI', default_uri)
+            _limiter = SlidingWindowLimiter(backend_from_uri(uri))
+            logger.info("Per-key rate limiting using %s", uri.split('://')[0])
+        return _limiter
+
+
+def key_limits(key_obj) -> List[Tuple[int, int]]:
+    """Quota for an APIKey row; unset columns fall back to config.json."""
+    defaults = config_section('rate_limit')
+    per_minute = key_obj.rate_limit_per_minute or defaults.get('requests_per_minute', 60)
+    per_hour = key_obj.rate_limit_per_hour or defaults.get('requests_per_hour', 1000)
+    return [(per_minute, MINUTE), (per_hour, HOUR)]
+
+
+def rate_limit_headers(status: Dict) -> Dict[str, str]:
+    headers = {
+        "X-RateLimit-Limit": str(status["limit"]),
+        "X-RateLimit-Remaining": str(status["remaining"]),
+        "X-RateLimit-Reset": str(status["reset"]),
+    }
+    if not status["allowed"]:
+        headers["Retry-After"] = str(status["reset"])
+    return headers
@@ -1,10 +1,23 @@
-from flask import request, jsonify, render_template, session, redirect, url_for
+from flask import request, jsonify, render_template, session, redirect, url_for, Response, make_response, g
 from app.models import get_session, APIKey, MessageLog
-from app.handlers import send_email, send_telegram, send_facebook
-from app.utils import report_error
+from app import handlers
+from app.breaker import CHANNELS, BATCH_CHANNELS, breaker_states, get_bad_recipients
+from app.handlers.errors import is_retryable
+from app.ratelimit import get_key_limiter, key_limits, rate_limit_headers
+from app.dispatcher import dispatch, dispatch_many, dispatch_stats, parse_priority, await_result, await_results
+from app.bodies import body_fields, prefetch_bodies
+from app.tracing import span, profiler
+from app.groups import (
+    group_index, normalize_members, create_group, delete_group, update_members,
+    list_groups, start_broadcast, broadcast_status
+)
+from app.deadletter import list_dead_letters, dead_letter_summary, purge_dead_letters, queue_replay, cancel_replay
+from app.callbacks import get_callbacks, emit
+from app.events import get_event_bus, sse_stream
+from app.utils import report_error, load_config, config_section
 from functools import wraps
-import json
 from datetime import datetime
+from typing import Optional
 
 
 def require_api_key(f):
@@ -14,17 +27,50 @@ def require_api_key(f):
         if not api_key:
             return jsonify({"error": "API key required"}), 401
 
-        db = get_session()
-        key_obj = db.query(APIKey).filter_by(key=api_key, is_active=True).first()
-        db.close()
+        with span('auth'):
+            db = get_session()
+            key_obj = db.query(APIKey).filter_by(key=api_key, is_active=True).first()
+            # Release the connection before any provider call; the view's
+            # writes reuse this request's session in a fresh transaction.
+            db.close()
 
         if not key_obj:
             return jsonify({"error": "Invalid API key"}), 401
+        g.api_key_id = key_obj.id
 
-        return f(*args, **kwargs)
+        with span('rate_limit'):
+            status = get_key_limiter().hit(str(key_obj.id), key_limits(key_obj))
+        headers = rate_limit_headers(status)
+        if not status["allowed"]:
+            return jsonify({"error": "Rate limit exceeded"}), 429, headers
+
+        response = make_response(f(*args, **kwargs))
+        response.headers.extend(headers)
+        return response
     return decorated
 
 
+def failed_auth_limit() -> str:
+    return f"{config_section('rate_limit').get('failed_auth_per_minute', 60)} per minute"
+
+
+def auth_failed(response) -> bool:
+    """Only requests rejected for a missing or unknown key count against the client IP."""
+    return response.status_code == 401
+
+
+def parse_quota(value) -> Optional[int]:
+    """None means the config.json default; anything else must be a positive integer. Raises ValueError."""
+    if value is None:
+        return None
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(value)
+    quota = int(value)
+    if quota <= 0:
+        raise ValueError(value)
+    return quota
+
+
 def require_admin(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -34,6 +80,84 @@ def require_admin(f):
     return decorated
 
 
+def dead_letter_filters(source) -> dict:
+    """Read dead-letter filters from query args or a JSON body; raises ValueError."""
+    filters = {k: source.get(k) for k in ('channel', 'recipient', 'reason', 'status', 'error_class')}
+    for k in ('since', 'until'):
+        filters[k] = datetime.fromisoformat(source[k]) if source.get(k) else None
+    ids = source.get('ids')
+    if isinstance(ids, str):
+        ids = ids.split(',')
+    filters['ids'] = [int(i) for i in ids] if ids else None
+    return filters
+
+
+def retrying_receipt(log_id: int, channel: str, recipient: str, result: dict, next_retry: datetime) -> dict:
+    """Callback fields for a /send failure that was queued for retry."""
+    return {"message_id": log_id, "channel": channel, "recipient": recipient, "attempts": 0,
+            "error_class": result.get('error_class'), "details": result.get('details'),
+            "next_retry": next_retry.isoformat()}
+
+
+def send_to_recipients(channel: str, recipients: list, message: str, priority: int):
+    """
+    /send with a recipient list: one batched provider call, one log row per
+    recipient, and only the retryable failures queued for retry, all in one
+    transaction.
+    """
+    from app.queue import add_many_to_retry_queue
+
+    with span('dispatch', channel=channel, priority=priority, recipients=len(recipients)):
+        results = await_results(channel, dispatch_many(channel, recipients, message, priority))
+
+    with span('db_write'):
+        db = get_session()
+        fields = body_fields(db, message)
+        logs = [
+            MessageLog(
+                channel=channel,
+                recipient=recipient,
+                **fields,
+                status=result['status'],
+                details=result.get('details', ''),
+                priority=priority,
+                api_key_id=g.api_key_id
+            )
+            for recipient, result in results.items()
+        ]
+        db.add_all(logs)
+        db.flush()
+        log_ids = [log.id for log in logs]
+
+    retry = [(recipient, log_id, result) for (recipient, result), log_id in zip(results.items(), log_ids)
+             if result['status'] == 'failed' and is_retryable(result)]
+    next_retries = []
+    if retry:
+        with span('retry_enqueue'):
+            next_retries = add_many_to_retry_queue(
+                [(channel, recipient) for recipient, _, _ in retry], message, priority,
+                api_key_id=g.api_key_id, log_ids=[log_id for _, log_id, _ in retry], db=db)
+    receipts = [retrying_receipt(log_id, channel, recipient, result, next_retry)
+                for (recipient, log_id, result), next_retry in zip(retry, next_retries)]
+
+    with span('db_commit'):
+        db.commit()
+    for receipt in receipts:
+        emit(g.api_key_id, 'retrying', **receipt)
+
+    queued = {receipt["recipient"]: receipt["next_retry"] for receipt in receipts}
+    accepted = sum(1 for result in results.values() if result['status'] == 'sent')
+    return jsonify({
+        "status": "sent" if accepted == len(results) else "failed",
+        "details": f"{accepted}/{len(results)} recipients accepted",
+        "results": [
+            dict(result, recipient=recipient, message_id=log_id,
+                 **({"retry_queued": True, "next_retry": queued[recipient]} if recipient in queued else {}))
+            for (recipient, result), log_id in zip(results.items(), log_ids)
+        ],
+    })
+
+
 def register_routes(app):
     from app import limiter
 
@@ -41,8 +165,11 @@ def register_routes(app):
     def index():
         return render_template('docs.html')
 
+    # Quotas for /send are enforced per API key by require_api_key, with
+    # counters shared across workers. The per-IP limit only counts failed
+    # authentication, so guessing keys is not free.
     @app.route('/send', methods=['POST', 'GET'])
-    @limiter.limit("60 per minute")
+    @limiter.limit(failed_auth_limit, deduct_when=auth_failed)
     @require_api_key
     def send_message():
         try:
@@ -51,46 +178,94 @@ def register_routes(app):
                 channel = data.get('channel')
                 recipient = data.get('recipient')
                 message = data.get('message')
+                priority = data.get('priority')
+                group = data.get('group')
             else:  # GET request
                 channel = request.args.get('channel')
                 recipient = request.args.get('recipient')
                 message = request.args.get('message')
+                priority = request.args.get('priority')
+                group = request.args.get('group')
+
+            try:
+                priority = parse_priority(priority)
+            except (TypeError, ValueError):
+                return jsonify({"error": "Invalid priority"}), 400
+
+            if group:
+                if not message:
+                    return jsonify({"error": "Missing required fields"}), 400
+                with span('broadcast', group=group):
+                    started = start_broadcast(group, message, priority, api_key_id=g.api_key_id)
+                if started is None:
+                    return jsonify({"error": "Unknown group"}), 404
+                return jsonify(dict(started, status="accepted")), 202
+
+            if isinstance(recipient, list):
+                recipient = [str(r).strip() for r in recipient if str(r).strip()]
 
             if not all([channel, recipient, message]):
                 return jsonify({"error": "Missing required fields"}), 400
 
-            result = None
-            if channel == 'email':
-                result = send_email(recipient, message)
-            elif channel == 'telegram':
-                result = send_telegram(recipient, message)
-            elif channel == 'facebook':
-                result = send_facebook(recipient, message)
-            else:
+            if channel not in CHANNELS:
                 return jsonify({"error": "Invalid channel"}), 400
 
-            db = get_session()
-            log = MessageLog(
-                channel=channel,
-                recipient=recipient,
-                message=message,
-                status=result['status'],
-                details=result.get('details', '')
-            )
-            db.add(log)
-            db.commit()
-            db.close()
-
-            if result['status'] == 'failed':
+            if isinstance(recipient, list):
+                if channel not in BATCH_CHANNELS:
+                    return jsonify({"error": f"Multiple recipients are only supported for {', '.join(BATCH_CHANNELS)}"}), 400
+                return send_to_recipients(channel, recipient, message, priority)
+
+            with span('dispatch', channel=channel, priority=priority):
+                result = await_result(channel, dispatch(channel, recipient, message, priority))
+
+            # The log row and any retry entry commit together in one transaction
+            with span('db_write'):
+                db = get_session()
+                log = MessageLog(
+                    channel=channel,
+                    recipient=recipient,
+                    **body_fields(db, message),
+                    status=result['status'],
+                    details=result.get('details', ''),
+                    priority=priority,
+                    api_key_id=g.api_key_id
+                )
+                db.add(log)
+                db.flush()
+                log_id = log.id
+
+            receipt = None
+            if result['status'] == 'failed' and is_retryable(result):
                 from app.queue import add_to_retry_queue
-                add_to_retry_queue(channel, recipient, message)
+                with span('retry_enqueue'):
+                    next_retry = add_to_retry_queue(channel, recipient, message, priority,
+                                                    api_key_id=g.api_key_id, message_log_id=log_id, db=db)
+                receipt = retrying_receipt(log_id, channel, recipient, result, next_retry)
 
-            return jsonify(result)
+            with span('db_commit'):
+                db.commit()
+            if receipt:
+                emit(g.api_key_id, 'retrying', **receipt)
+                return jsonify(dict(result, message_id=log_id, retry_queued=True, next_retry=receipt["next_retry"]))
+
+            return jsonify(dict(result, message_id=log_id))
 
         except Exception as e:
-            report_error(f"Error in /send endpoint: {str(e)}")
+            get_session().rollback()
+            with span('report_error'):
+                report_error(f"Error in /send endpoint: {str(e)}")
             return jsonify({"status": "failed", "details": str(e)}), 500
 
+    # Status polling is bounded by the per-key quota rather than the IP default
+    @app.route('/broadcasts/<int:broadcast_id>')
+    @limiter.limit(failed_auth_limit, deduct_when=auth_failed)
+    @require_api_key
+    def get_broadcast(broadcast_id):
+        status = broadcast_status(broadcast_id, g.api_key_id)
+        if status is None:
+            return jsonify({"error": "Broadcast not found"}), 404
+        return jsonify(status)
+
     @app.route('/webhook', methods=['GET', 'POST'])
     def facebook_webhook():
         from app.utils import load_env_encrypted
@@ -109,11 +284,24 @@ def register_routes(app):
             handle_messenger_event(data)
             return 'OK', 200
 
+    @app.route('/telegram/webhook', methods=['POST'])
+    def telegram_webhook():
+        from app.handlers.telegram_handler import verify_webhook_secret, process_webhook_update
+        if not verify_webhook_secret(request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')):
+            return 'Invalid secret token', 403
+
+        data = request.get_json(silent=True)
+        if not data:
+            return 'Bad Request', 400
+
+        if not process_webhook_update(data):
+            return 'Telegram webhook not running', 503
+        return 'OK', 200
+
     @app.route('/admin/login', methods=['GET', 'POST'])
     def admin_login():
         if request.method == 'POST':
-            with open('config.json', 'r') as f:
-                config = json.load(f)
+            config = load_config()
 
             username = request.form.get('username')
             password = request.form.get('password')
@@ -132,10 +320,130 @@ def register_routes(app):
     def admin_dashboard():
         db = get_session()
         logs = db.query(MessageLog).order_by(MessageLog.created_at.desc()).limit(100).all()
+        prefetch_bodies(log.body_hash for log in logs)
         api_keys = db.query(APIKey).all()
         db.close()
 
-        return render_template('admin.html', logs=logs, api_keys=api_keys)
+        return render_template('admin.html', logs=logs, api_keys=api_keys, breakers=breaker_states(),
+                               bulkheads=dispatch_stats())
+
+    @app.route('/admin/stream')
+    @require_admin
+    def admin_stream():
+        q = get_event_bus().subscribe()
+        if q is None:
+            return jsonify({"error": "Too many dashboard viewers"}), 503
+        return Response(
+            sse_stream(q),
+            mimetype='text/event-stream',
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    @app.route('/admin/metrics')
+    @require_admin
+    def admin_metrics():
+        return jsonify({
+            "circuit_breakers": breaker_states(),
+            "bulkheads": dispatch_stats(),
+            "bad_recipients": len(get_bad_recipients()),
+            "dead_letters": dead_letter_summary(),
+            "callbacks": get_callbacks().status(),
+        })
+
+    @app.route('/admin/dead-letters', methods=['GET', 'DELETE'])
+    @require_admin
+    def admin_dead_letters():
+        from app.export import encode_cursor, decode_cursor
+
+        try:
+            filters = dead_letter_filters(request.args)
+            after_id = decode_cursor(request.args['cursor']) if request.args.get('cursor') else 0
+            limit = min(int(request.args.get('limit', 100)), 1000)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if request.method == 'DELETE':
+            return jsonify({"deleted": purge_dead_letters(filters)})
+
+        items = list_dead_letters(filters, limit=limit, after_id=after_id)
+        return jsonify({
+            "items": items,
+            "next_cursor": encode_cursor(items[-1]['id']) if len(items) == limit else None,
+            "summary": dead_letter_summary(),
+        })
+
+    @app.route('/admin/dead-letters/replay', methods=['POST'])
+    @require_admin
+    def replay_dead_letters():
+        data = request.json or {}
+        try:
+            filters = dead_letter_filters(data)
+            rate = float(data['rate']) if data.get('rate') is not None else None
+            concurrency = int(data['concurrency']) if data.get('concurrency') is not None else None
+            if (rate is not None and rate <= 0) or (concurrency is not None and concurrency < 1):
+                raise ValueError("rate and concurrency must be positive")
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        # Only rows currently at rest are eligible; the status filter can't widen that
+        filters['status'] = 'dead'
+        return jsonify(queue_replay(filters, rate=rate, concurrency=concurrency)), 202
+
+    @app.route('/admin/dead-letters/replay/cancel', methods=['POST'])
+    @require_admin
+    def cancel_dead_letter_replay():
+        return jsonify({"cancelled": cancel_replay()})
+
+    @app.route('/admin/export')
+    @require_admin
+    def export_logs():
+        from app.export import iter_message_logs, ndjson_lines, csv_lines, encode_chunks, decode_cursor
+
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('ndjson', 'csv'):
+            return jsonify({"error": "format must be ndjson or csv"}), 400
+        use_gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+        try:
+            since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+            until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+            after_id = decode_cursor(request.args['cursor']) if request.args.get('cursor') else 0
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        rows = iter_message_logs(
+            since=since,
+            until=until,
+            channel=request.args.get('channel'),
+            status=request.args.get('status'),
+            after_id=after_id
+        )
+        lines = ndjson_lines(rows) if fmt == 'ndjson' else csv_lines(rows)
+
+        filename = f"message_logs.{fmt}" + (".gz" if use_gzip else "")
+        if use_gzip:
+            mimetype = 'application/gzip'
+        else:
+            mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+        return Response(
+            encode_chunks(lines, gzip=use_gzip),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
+
+    @app.route('/admin/profile', methods=['GET', 'POST'])
+    @require_admin
+    def profile_requests():
+        if request.method == 'POST':
+            data = request.json or {}
+            try:
+                count = int(data.get('requests', 10))
+            except (TypeError, ValueError):
+                return jsonify({"error": "requests must be an integer"}), 400
+            if count < 1:
+                return jsonify({"error": "requests must be positive"}), 400
+            profiler.arm(count, data.get('sort', 'cumulative'))
+        # Profiles are per worker: poll this endpoint until the report appears
+        return jsonify(profiler.status())
 
     @app.route('/admin/logout')
     def admin_logout():
@@ -158,6 +466,102 @@ def register_routes(app):
 
         return jsonify({"key": new_key})
 
+    @app.route('/admin/keys/<int:key_id>/quota', methods=['POST'])
+    @require_admin
+    def set_key_quota(key_id):
+        data = request.json or {}
+        try:
+            per_minute = parse_quota(data.get('per_minute'))
+            per_hour = parse_quota(data.get('per_hour'))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Quotas must be positive integers, or null for the default"}), 400
+
+        db = get_session()
+        api_key = db.get(APIKey, key_id)
+        if not api_key:
+            db.close()
+            return jsonify({"error": "API key not found"}), 404
+        api_key.rate_limit_per_minute = per_minute
+        api_key.rate_limit_per_hour = per_hour
+        db.commit()
+        db.close()
+
+        return jsonify({"id": key_id, "per_minute": per_minute, "per_hour": per_hour})
+
+    @app.route('/admin/keys/<int:key_id>/callback', methods=['POST'])
+    @require_admin
+    def set_key_callback(key_id):
+        import secrets
+        from urllib.parse import urlparse
+
+        data = request.json or {}
+        url = (data.get('url') or '').strip() or None
+        if url and urlparse(url).scheme not in ('http', 'https'):
+            return jsonify({"error": "Callback URL must be http(s)"}), 400
+
+        db = get_session()
+        api_key = db.get(APIKey, key_id)
+        if not api_key:
+            db.close()
+            return jsonify({"error": "API key not found"}), 404
+        api_key.callback_url = url
+        if url and (data.get('rotate_secret') or not api_key.callback_secret):
+            api_key.callback_secret = secrets.token_hex(32)
+        secret = api_key.callback_secret
+        db.commit()
+        db.close()
+        get_callbacks().invalidate(key_id)
+
+        return jsonify({"id": key_id, "url": url, "secret": secret})
+
+    @app.route('/admin/groups', methods=['GET', 'POST'])
+    @require_admin
+    def admin_groups():
+        if request.method == 'POST':
+            data = request.json or {}
+            name = (data.get('name') or '').strip()
+            if not name:
+                return jsonify({"error": "Group name required"}), 400
+            try:
+                members = normalize_members(data.get('members'))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if not create_group(name):
+                return jsonify({"error": "Group already exists"}), 409
+            count = update_members(name, add=members)
+            return jsonify({"name": name, "members": count}), 201
+
+        return jsonify(list_groups())
+
+    @app.route('/admin/groups/<name>', methods=['DELETE'])
+    @require_admin
+    def admin_delete_group(name):
+        if not delete_group(name):
+            return jsonify({"error": "Group not found"}), 404
+        return jsonify({"deleted": name})
+
+    @app.route('/admin/groups/<name>/members', methods=['GET', 'POST', 'DELETE'])
+    @require_admin
+    def admin_group_members(name):
+        if request.method == 'GET':
+            members = group_index.members(name)
+            if members is None:
+                return jsonify({"error": "Group not found"}), 404
+            return jsonify([{"channel": c, "recipient": r} for c, r in members])
+
+        try:
+            members = normalize_members((request.json or {}).get('members'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if request.method == 'POST':
+            count = update_members(name, add=members)
+        else:
+            count = update_members(name, remove=members)
+        if count is None:
+            return jsonify({"error": "Group not found"}), 404
+        return jsonify({"name": name, "members": count})
+
     @app.route('/admin/test/<channel>', methods=['POST'])
     @require_admin
     def test_channel(channel):
@@ -167,10 +571,10 @@ def register_routes(app):
 
         result = None
         if channel == 'email':
-            result = send_email(recipient, message)
+            result = handlers.send_email(recipient, message)
         elif channel == 'telegram':
-            result = send_telegram(recipient, message)
+            result = handlers.send_telegram(recipient, message)
         elif channel == 'facebook':
-            result = send_facebook(recipient, message)
+            result = handlers.send_facebook(recipient, message)
 
         return jsonify(result)
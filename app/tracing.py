@@ -0,0 +1,200 @@
+import io
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.utils.config import config_section
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('alertbot.slow')
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('alertbot_trace', default=None)
+
+
+class Trace:
+    """Spans recorded for one request or background job."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, end: float, **attrs):
+        span = {
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 2),
+            "duration_ms": round((end - start) * 1000, 2),
+        }
+        if attrs:
+            span.update(attrs)
+        with self._lock:
+            self.spans.append(span)
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+
+def _settings() -> Dict[str, Any]:
+    return config_section('tracing')
+
+
+_slow_log_configured = False
+
+
+def _configure_slow_log():
+    global _slow_log_configured
+    if _slow_log_configured:
+        return
+    path = _settings().get('slow_log')
+    if path:
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        slow_logger.addHandler(handler)
+        slow_logger.propagate = False
+    _slow_log_configured = True
+
+
+def start_trace(name: str) -> contextvars.Token:
+    return _current_trace.set(Trace(name))
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def finish_trace(token: contextvars.Token, **attrs) -> Optional[Dict[str, Any]]:
+    """
+    End the active trace. Traces slower than tracing.slow_threshold_ms are
+    written to the slow-request log. Returns the trace record when it was slow.
+    """
+    trace = _current_trace.get()
+    try:
+        _current_trace.reset(token)
+    except ValueError:
+        # Token from another context (e.g. a copied one); just clear ours
+        _current_trace.set(None)
+    if trace is None:
+        return None
+
+    total_ms = trace.total_ms()
+    if total_ms < _settings().get('slow_threshold_ms', 1000):
+        return None
+
+    record = {
+        "at": datetime.utcnow().isoformat(),
+        "trace": trace.name,
+        "total_ms": round(total_ms, 2),
+        "spans": trace.spans,
+    }
+    record.update(attrs)
+    _configure_slow_log()
+    slow_logger.warning(json.dumps(record))
+    return record
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block as a span of the active trace; a no-op when none is active."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, start, time.perf_counter(), **attrs)
+
+
+@contextmanager
+def traced(name: str, **attrs):
+    """Run a block as its own trace (used by background jobs)."""
+    token = start_trace(name)
+    try:
+        yield
+    finally:
+        finish_trace(token, **attrs)
+
+
+class RequestProfiler:
+    """
+    Admin-armed cProfile capture: profiles the next N requests handled by
+    this worker and keeps the combined report. Only the request thread is
+    profiled; provider calls made on dispatcher threads show up as waits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining = 0
+        self.requested = 0
+        self.sort = 'cumulative'
+        self._stats: Optional[pstats.Stats] = None
+        self.report: Optional[str] = None
+
+    def arm(self, requests: int, sort: str = 'cumulative'):
+        with self._lock:
+            self.remaining = requests
+            self.requested = requests
+            self.sort = sort
+            self._stats = None
+            self.report = None
+
+    def start(self) -> Optional[cProfile.Profile]:
+        with self._lock:
+            if self.remaining <= 0:
+                return None
+            self.remaining -= 1
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return None
+        return profile
+
+    def stop(self, profile: cProfile.Profile):
+        profile.disable()
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            if self.remaining <= 0:
+                out = io.StringIO()
+                self._stats.stream = out
+                self._stats.sort_stats(self.sort).print_stats(50)
+                self.report = out.getvalue()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"remaining": self.remaining, "requested": self.requested, "report": self.report}
+
+
+profiler = RequestProfiler()
+
+
+def init_tracing(app):
+    """Wrap every request in a trace and hook up the on-demand profiler."""
+    from flask import g, request
+
+    @app.before_request
+    def _begin_trace():
+        g.trace_token = start_trace(f"{request.method} {request.path}")
+        g.profile = profiler.start()
+
+    @app.teardown_request
+    def _end_trace(exc):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profiler.stop(profile)
+        token = g.pop('trace_token', None)
+        if token is not None:
+            finish_trace(token, error=str(exc) if exc else None)
@@ -1,4 +1,7 @@
 from .encryption import encrypt_data, decrypt_data, load_env_encrypted
 from .error_reporter import report_error
+from .leader import run_as_leader, is_leader
+from .config import load_config, config_section
 
-__all__ = ['encrypt_data', 'decrypt_data', 'load_env_encrypted', 'report_error']
+__all__ = ['encrypt_data', 'decrypt_data', 'load_env_encrypted', 'report_error', 'run_as_leader', 'is_leader',
+           'load_config', 'config_section']
@@ -0,0 +1,32 @@
+import os
+import json
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+CONFIG_PATH = 'config.json'
+
+_cached: Optional[Tuple[Tuple[int, int], Dict[str, Any]]] = None
+_lock = threading.Lock()
+
+
+def load_config() -> Dict[str, Any]:
+    """
+    Parsed config.json, shared by every module. The file is re-parsed only
+    when its mtime or size changes, so edits take effect without a restart
+    while an unchanged file costs one stat() per call. Values read into
+    long-lived objects when they are built (dispatchers, caches, the event
+    bus) still need a restart to change. Treat the result as read-only.
+    """
+    global _cached
+    st = os.stat(CONFIG_PATH)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _lock:
+        if _cached is None or _cached[0] != stamp:
+            with open(CONFIG_PATH, 'r') as f:
+                _cached = (stamp, json.load(f))
+        return _cached[1]
+
+
+def config_section(name: str) -> Dict[str, Any]:
+    """One top-level section of config.json; empty when it is missing."""
+    return load_config().get(name, {})
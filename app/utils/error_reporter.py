@@ -1,10 +1,9 @@
 import requests
-import json
-from telegram import Bot
 import os
 import asyncio
 from functools import wraps
 from app.utils.encryption import load_env_encrypted
+from app.utils.config import load_config
 
 def async_to_sync(func):
     @wraps(func)
@@ -19,8 +18,7 @@ def async_to_sync(func):
 
 @async_to_sync
 async def report_error(error_message: str):
-    with open('config.json', 'r') as f:
-        config = json.load(f)
+    config = load_config()
     
     admin_telegram = config['admin'].get('telegram_chat_id')
     admin_facebook = config['admin'].get('facebook_psid')
@@ -29,6 +27,7 @@ async def report_error(error_message: str):
     
     if admin_telegram:
         try:
+            from telegram import Bot
             bot = Bot(token=load_env_encrypted('TELEGRAM_BOT_TOKEN', ''))
             await bot.send_message(chat_id=admin_telegram, text=error_text)
         except Exception as e:
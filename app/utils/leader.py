@@ -0,0 +1,114 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+from typing import Callable, Dict
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Open lock files for roles this process currently leads. Keeping the file
+# object referenced keeps the flock held until it is released or the
+# process exits.
+_held_locks: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def leader_election_enabled() -> bool:
+    return os.getenv('LEADER_ELECTION', '1').lower() not in ('0', 'false', 'no')
+
+
+def _lock_path(role: str) -> str:
+    lock_dir = os.getenv('LEADER_LOCK_DIR', tempfile.gettempdir())
+    return os.path.join(lock_dir, f"alertbot-{role}.lock")
+
+
+def try_acquire_leadership(role: str) -> bool:
+    """
+    Try once to become the leader for `role` by taking an exclusive,
+    non-blocking flock on a shared lock file. The kernel drops the lock when
+    the holding process dies, so no heartbeat or lease expiry is needed.
+    """
+    with _lock:
+        if role in _held_locks:
+            return True
+        if fcntl is None:
+            _held_locks[role] = None
+            return True
+
+        f = open(_lock_path(role), 'a+')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        _held_locks[role] = f
+        return True
+
+
+def release_leadership(role: str):
+    """Give up `role` so another process (or this one, later) can win it."""
+    with _lock:
+        f = _held_locks.pop(role, None)
+        if f is not None:
+            f.close()  # closing the descriptor drops the flock
+
+
+def is_leader(role: str) -> bool:
+    return role in _held_locks
+
+
+def run_as_leader(role: str, target: Callable[[], None], poll_interval: float = None) -> threading.Thread:
+    """
+    Run `target` in exactly one process per host for the given role.
+    A daemon thread retries the lock every `poll_interval` seconds (env
+    LEADER_POLL_INTERVAL, default 2s) and calls `target` once it wins, so a
+    standby worker takes over within seconds if the leader dies.
+
+    Leadership lasts exactly as long as `target` runs: it should block for
+    as long as the role's work goes on. When it returns or raises, the lock
+    is released and the thread rejoins the election after a back-off
+    (doubling up to LEADER_MAX_BACKOFF, default 60s, while the target keeps
+    exiting quickly), so a failed leader task is retried here or elsewhere.
+    When LEADER_ELECTION=0 the target simply runs, and is restarted, in
+    every process.
+    """
+    if poll_interval is None:
+        poll_interval = float(os.getenv('LEADER_POLL_INTERVAL', '2'))
+    max_backoff = float(os.getenv('LEADER_MAX_BACKOFF', '60'))
+
+    def _elect():
+        backoff = poll_interval
+        while True:
+            if leader_election_enabled():
+                while not try_acquire_leadership(role):
+                    time.sleep(poll_interval)
+                logger.info("👑 Process %s is leader for %s", os.getpid(), role)
+
+            started = time.monotonic()
+            try:
+                target()
+                logger.warning("Leader task %s exited; releasing leadership", role)
+            except Exception:
+                logger.exception("Leader task %s failed; releasing leadership", role)
+            finally:
+                release_leadership(role)
+
+            # A task that ran for a while gets a prompt restart; one that keeps
+            # dying immediately is retried less and less often
+            backoff = poll_interval if time.monotonic() - started > max_backoff else min(backoff * 2, max_backoff)
+            time.sleep(backoff)
+
+    t = threading.Thread(target=_elect, name=f"leader-{role}", daemon=True)
+    t.start()
+    return t
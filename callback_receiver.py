@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Stand-in client endpoint for testing delivery-receipt callbacks locally."""
+import sys
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from app.callbacks import verify_signature, SIGNATURE_HEADER, TIMESTAMP_HEADER
+
+
+def make_handler(secret: str, fail_every: int):
+    received = {"batches": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            received["batches"] += 1
+
+            if not verify_signature(secret, self.headers.get(TIMESTAMP_HEADER),
+                                    body, self.headers.get(SIGNATURE_HEADER)):
+                print("✗ rejected batch: bad signature")
+                self.send_response(401)
+                self.end_headers()
+                return
+
+            # Optionally fail every Nth batch to exercise the sender's retries
+            if fail_every and received["batches"] % fail_every == 0:
+                print(f"↻ simulating failure for batch {received['batches']}")
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            events = json.loads(body)["events"]
+            print(f"✓ batch {received['batches']}: {len(events)} events")
+            for event in events:
+                print("   ", json.dumps(event))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python callback_receiver.py <port> <secret> [fail_every]")
+        print("\nExample:")
+        print("  python callback_receiver.py 9000 <secret from /admin/keys/<id>/callback>")
+        print("\nThen point the key's callback URL at http://localhost:9000/")
+        sys.exit(1)
+
+    port = int(sys.argv[1])
+    secret = sys.argv[2]
+    fail_every = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    print(f"Listening for callbacks on http://localhost:{port}/")
+    HTTPServer(('', port), make_handler(secret, fail_every)).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
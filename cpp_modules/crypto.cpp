@@ -1,49 +1,187 @@
 #include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
 #include <string>
+#include <vector>
+#include <stdexcept>
 #include <algorithm>
 
 namespace py = pybind11;
 
+// Inputs at least this large are processed with the GIL released.
+static const size_t GIL_RELEASE_THRESHOLD = 64 * 1024;
+
+static const char HEX_DIGITS[] = "0123456789abcdef";
+
+struct HexDecodeTable {
+    signed char value[256];
+    HexDecodeTable() {
+        std::fill(value, value + 256, static_cast<signed char>(-1));
+        for (int i = 0; i < 10; ++i) value['0' + i] = static_cast<signed char>(i);
+        for (int i = 0; i < 6; ++i) {
+            value['a' + i] = static_cast<signed char>(10 + i);
+            value['A' + i] = static_cast<signed char>(10 + i);
+        }
+    }
+};
+
+static const HexDecodeTable HEX_DECODE;
+
+// XOR `n` bytes of `in` with the repeating key and write 2*n hex chars to `out`.
+static void xor_hex_encode(const unsigned char* in, size_t n,
+                           const unsigned char* key, size_t key_len, char* out) {
+    size_t k = 0;
+    for (size_t i = 0; i < n; ++i) {
+        unsigned char c = in[i] ^ key[k];
+        out[2 * i] = HEX_DIGITS[c >> 4];
+        out[2 * i + 1] = HEX_DIGITS[c & 0x0f];
+        if (++k == key_len) k = 0;
+    }
+}
+
+// Decode `n` hex chars from `in` and XOR with the repeating key into `out`
+// (n / 2 bytes). Returns false on a non-hex character.
+static bool hex_decode_xor(const char* in, size_t n,
+                           const unsigned char* key, size_t key_len, unsigned char* out) {
+    size_t k = 0;
+    for (size_t i = 0; i < n / 2; ++i) {
+        signed char hi = HEX_DECODE.value[static_cast<unsigned char>(in[2 * i])];
+        signed char lo = HEX_DECODE.value[static_cast<unsigned char>(in[2 * i + 1])];
+        if (hi < 0 || lo < 0) return false;
+        out[i] = static_cast<unsigned char>((hi << 4) | lo) ^ key[k];
+        if (++k == key_len) k = 0;
+    }
+    return true;
+}
+
+static void check_key(const std::string& key) {
+    if (key.empty()) throw std::invalid_argument("key must not be empty");
+}
+
+static void check_hex_length(size_t n) {
+    if (n % 2 != 0) throw std::invalid_argument("encrypted data must have an even number of hex digits");
+}
+
 std::string simple_encrypt(const std::string& data, const std::string& key) {
-    std::string result = data;
-    size_t key_len = key.length();
-    
-    for (size_t i = 0; i < result.length(); ++i) {
-        result[i] = result[i] ^ key[i % key_len];
-    }
-    
-    std::string encoded;
-    for (unsigned char c : result) {
-        char hex[3];
-        snprintf(hex, sizeof(hex), "%02x", c);
-        encoded += hex;
-    }
-    
+    check_key(key);
+    std::string encoded(data.size() * 2, '\0');
+    xor_hex_encode(reinterpret_cast<const unsigned char*>(data.data()), data.size(),
+                   reinterpret_cast<const unsigned char*>(key.data()), key.size(), &encoded[0]);
     return encoded;
 }
 
 std::string simple_decrypt(const std::string& encrypted, const std::string& key) {
-    std::string decoded;
-    for (size_t i = 0; i < encrypted.length(); i += 2) {
-        std::string byte = encrypted.substr(i, 2);
-        char c = static_cast<char>(std::stoi(byte, nullptr, 16));
-        decoded += c;
-    }
-    
-    std::string result = decoded;
-    size_t key_len = key.length();
-    
-    for (size_t i = 0; i < result.length(); ++i) {
-        result[i] = result[i] ^ key[i % key_len];
-    }
-    
+    check_key(key);
+    check_hex_length(encrypted.size());
+    std::string result(encrypted.size() / 2, '\0');
+    if (!hex_decode_xor(encrypted.data(), encrypted.size(),
+                        reinterpret_cast<const unsigned char*>(key.data()), key.size(),
+                        reinterpret_cast<unsigned char*>(&result[0]))) {
+        throw std::invalid_argument("encrypted data contains non-hex characters");
+    }
     return result;
 }
 
+static py::buffer_info contiguous_bytes(const py::buffer& buf) {
+    py::buffer_info info = buf.request();
+    // Every dimension is checked, 1-D included: a strided or reversed
+    // memoryview would otherwise be read as if its items were adjacent.
+    // Axes of length 0 or 1 are never stepped over, so their stride is free.
+    for (py::ssize_t i = info.ndim - 1, expected = info.itemsize; i >= 0; --i) {
+        if (info.shape[i] > 1 && info.strides[i] != expected) {
+            throw std::invalid_argument("buffer must be C-contiguous");
+        }
+        expected *= info.shape[i];
+    }
+    return info;
+}
+
+py::bytes encrypt_buffer(const py::buffer& data, const std::string& key) {
+    check_key(key);
+    py::buffer_info info = contiguous_bytes(data);
+    size_t n = static_cast<size_t>(info.size * info.itemsize);
+
+    PyObject* out = PyBytes_FromStringAndSize(nullptr, static_cast<py::ssize_t>(n * 2));
+    if (!out) throw py::error_already_set();
+    py::bytes result = py::reinterpret_steal<py::bytes>(out);
+    char* dst = PyBytes_AS_STRING(out);
+    const unsigned char* src = static_cast<const unsigned char*>(info.ptr);
+    const unsigned char* k = reinterpret_cast<const unsigned char*>(key.data());
+
+    if (n >= GIL_RELEASE_THRESHOLD) {
+        py::gil_scoped_release release;
+        xor_hex_encode(src, n, k, key.size(), dst);
+    } else {
+        xor_hex_encode(src, n, k, key.size(), dst);
+    }
+    return result;
+}
+
+py::bytes decrypt_buffer(const py::buffer& encrypted, const std::string& key) {
+    check_key(key);
+    py::buffer_info info = contiguous_bytes(encrypted);
+    size_t n = static_cast<size_t>(info.size * info.itemsize);
+    check_hex_length(n);
+
+    PyObject* out = PyBytes_FromStringAndSize(nullptr, static_cast<py::ssize_t>(n / 2));
+    if (!out) throw py::error_already_set();
+    py::bytes result = py::reinterpret_steal<py::bytes>(out);
+    unsigned char* dst = reinterpret_cast<unsigned char*>(PyBytes_AS_STRING(out));
+    const char* src = static_cast<const char*>(info.ptr);
+    const unsigned char* k = reinterpret_cast<const unsigned char*>(key.data());
+
+    bool ok;
+    if (n >= GIL_RELEASE_THRESHOLD) {
+        py::gil_scoped_release release;
+        ok = hex_decode_xor(src, n, k, key.size(), dst);
+    } else {
+        ok = hex_decode_xor(src, n, k, key.size(), dst);
+    }
+    if (!ok) throw std::invalid_argument("encrypted data contains non-hex characters");
+    return result;
+}
+
+std::vector<std::string> encrypt_many(const std::vector<std::string>& values, const std::string& key) {
+    check_key(key);
+    std::vector<std::string> out(values.size());
+    py::gil_scoped_release release;
+    for (size_t i = 0; i < values.size(); ++i) {
+        out[i] = simple_encrypt(values[i], key);
+    }
+    return out;
+}
+
+std::vector<std::string> decrypt_many(const std::vector<std::string>& values, const std::string& key) {
+    check_key(key);
+    for (const std::string& v : values) check_hex_length(v.size());
+    std::vector<std::string> out(values.size());
+    bool ok = true;
+    {
+        py::gil_scoped_release release;
+        const unsigned char* k = reinterpret_cast<const unsigned char*>(key.data());
+        for (size_t i = 0; i < values.size() && ok; ++i) {
+            out[i].resize(values[i].size() / 2);
+            ok = hex_decode_xor(values[i].data(), values[i].size(), k, key.size(),
+                                reinterpret_cast<unsigned char*>(&out[i][0]));
+        }
+    }
+    if (!ok) throw std::invalid_argument("encrypted data contains non-hex characters");
+    return out;
+}
+
 PYBIND11_MODULE(crypto, m) {
     m.doc() = "AlertBot encryption module";
     m.def("encrypt", &simple_encrypt, "Encrypt data with XOR cipher",
           py::arg("data"), py::arg("key"));
     m.def("decrypt", &simple_decrypt, "Decrypt data with XOR cipher",
           py::arg("encrypted"), py::arg("key"));
+    m.def("encrypt_bytes", &encrypt_buffer,
+          "Encrypt a bytes-like object; returns hex-encoded bytes",
+          py::arg("data"), py::arg("key"));
+    m.def("decrypt_bytes", &decrypt_buffer,
+          "Decrypt hex-encoded bytes-like data; returns raw bytes",
+          py::arg("encrypted"), py::arg("key"));
+    m.def("encrypt_many", &encrypt_many, "Encrypt a list of values with XOR cipher",
+          py::arg("values"), py::arg("key"));
+    m.def("decrypt_many", &decrypt_many, "Decrypt a list of values with XOR cipher",
+          py::arg("values"), py::arg("key"));
 }
@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+import pytest
+
+# app.models binds its engine when first imported, so point it at a scratch
+# database before any test module imports the app
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'alertbot-test.db'))
+os.environ.setdefault('RATE_LIMIT_STORAGE_URI', 'memory://')
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The API routes on a bare Flask app: no leader election, scheduler or bots."""
+    from flask import Flask
+    from app import limiter, safe_init_db
+    from app.models import Base, SessionLocal, get_engine
+    from app.routes import register_routes
+
+    flask_app = Flask('alertbot-test', root_path=os.path.join(os.path.dirname(__file__), '..', 'app'))
+    flask_app.config['SECRET_KEY'] = 'test'
+    limiter.init_app(flask_app)
+    safe_init_db(get_engine(), Base)
+
+    @flask_app.teardown_appcontext
+    def remove_session(exc=None):
+        SessionLocal.remove()
+
+    register_routes(flask_app)
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def api_key(app):
+    """A fresh active key with a callback URL, so receipts look up their target."""
+    import secrets
+    from app.models import get_session, APIKey
+
+    db = get_session()
+    key = APIKey(key=f"ALB-{secrets.token_hex(4)}", callback_url='http://127.0.0.1:9/receipts',
+                 callback_secret='test-secret')
+    db.add(key)
+    db.commit()
+    value = key.key
+    db.close()
+    return value
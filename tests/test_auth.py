@@ -0,0 +1,49 @@
+from unittest import mock
+
+import pytest
+
+from app.models import get_session, APIKey
+
+
+def test_failed_auth_is_limited_per_ip(client, api_key):
+    bad = {"X-API-Key": "ALB-00000000"}
+    ip = {"REMOTE_ADDR": "203.0.113.7"}
+    send = lambda headers: client.get('/send', headers=headers, environ_base=ip)
+
+    with mock.patch('app.routes.config_section', lambda name: {"failed_auth_per_minute": 3}):
+        assert [send(bad).status_code for _ in range(3)] == [401, 401, 401]
+        assert send(bad).status_code == 429
+        assert send({}).status_code == 429
+        # Valid keys never count, so another client is unaffected
+        other = {"REMOTE_ADDR": "203.0.113.8"}
+        assert [client.get('/send', headers={"X-API-Key": api_key}, environ_base=other).status_code
+                for _ in range(5)] == [400] * 5
+
+
+@pytest.fixture
+def admin(client):
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    return client
+
+
+@pytest.mark.parametrize("value", [0, -5, 1.5, "abc", "", True])
+def test_quota_rejects_non_positive_integers(admin, api_key, value):
+    key_id = _key_id(api_key)
+    response = admin.post(f'/admin/keys/{key_id}/quota', json={"per_minute": value})
+    assert response.status_code == 400
+
+
+def test_quota_accepts_positive_integers_and_null(admin, api_key):
+    key_id = _key_id(api_key)
+    response = admin.post(f'/admin/keys/{key_id}/quota', json={"per_minute": 120, "per_hour": None})
+    assert response.status_code == 200
+    assert response.json == {"id": key_id, "per_minute": 120, "per_hour": None}
+
+
+def _key_id(value: str) -> int:
+    db = get_session()
+    try:
+        return db.query(APIKey.id).filter_by(key=value).scalar()
+    finally:
+        db.close()
@@ -0,0 +1,42 @@
+from unittest import mock
+
+from app.bodies import body_fields
+from app.deadletter import ReplayWorker, queue_replay
+from app.models import get_session, DeadLetter, RetryQueue
+
+TRANSIENT = {"status": "failed", "details": "502 Bad Gateway", "error_class": "provider", "retryable": True}
+PERMANENT = {"status": "failed", "details": "chat not found", "error_class": "invalid_recipient", "retryable": False}
+
+
+def test_replay_retries_transient_failures_and_rests_permanent_ones(app):
+    db = get_session()
+    letters = [
+        DeadLetter(channel='telegram', recipient=recipient, **body_fields(db, "replay me"), reason='exhausted',
+                   attempts=3, api_key_id=7, message_log_id=log_id)
+        for recipient, log_id in (("flaky", 101), ("gone", 102))
+    ]
+    db.add_all(letters)
+    db.commit()
+    ids = [letter.id for letter in letters]
+    db.close()
+
+    job = queue_replay({"ids": ids}, rate=100, concurrency=10)
+    results = {"flaky": TRANSIENT, "gone": PERMANENT}
+    with mock.patch('app.breaker.guarded_send', lambda channel, recipient, message: results[recipient]), \
+            mock.patch('app.deadletter.emit') as emit:
+        ReplayWorker()._run()
+
+    db = get_session()
+    try:
+        item = db.query(RetryQueue).filter_by(recipient="flaky").one()
+        assert (item.channel, item.message_text, item.api_key_id, item.message_log_id) == \
+            ("telegram", "replay me", 7, 101)
+        remaining = db.query(DeadLetter).filter(DeadLetter.id.in_(ids)).all()
+        assert [(l.recipient, l.status, l.replay_count) for l in remaining] == [("gone", "dead", 1)]
+    finally:
+        db.close()
+
+    events = {call.args[1]: call.kwargs for call in emit.call_args_list}
+    assert events["retrying"]["recipient"] == "flaky" and events["retrying"]["next_retry"]
+    assert events["dead_lettered"]["recipient"] == "gone"
+    assert job["queued"] == 2
@@ -0,0 +1,28 @@
+import threading
+
+import pytest
+
+from app.dispatcher import BulkheadFull, PriorityDispatcher
+
+WEIGHTS = {1: 6, 2: 3, 3: 1}
+MAX_QUEUED = 5
+
+
+def test_low_priority_flood_does_not_reject_high_priority():
+    dispatcher = PriorityDispatcher(4, WEIGHTS, {1: 2}, max_queued=MAX_QUEUED)
+    gate = threading.Event()
+    try:
+        with pytest.raises(BulkheadFull):
+            for _ in range(50):
+                dispatcher.submit(3, gate.wait)
+        assert dispatcher.free_slots(3) == 0
+        assert dispatcher.free_slots(1) == MAX_QUEUED
+        # P1's reserved workers are idle, so the page goes straight out
+        assert dispatcher.submit(1, lambda: "sent").result(timeout=5) == "sent"
+    finally:
+        gate.set()
+
+
+def test_free_slots_is_none_when_unbounded():
+    dispatcher = PriorityDispatcher(1, WEIGHTS, {})
+    assert dispatcher.free_slots(1) is None
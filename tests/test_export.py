@@ -0,0 +1,31 @@
+from sqlalchemy import event
+
+from app import bodies, export
+from app.models import get_session, get_engine, MessageLog
+from app.bodies import body_fields
+
+ROWS = 30
+
+
+def test_export_loads_bodies_once_per_batch(app, monkeypatch):
+    db = get_session()
+    logs = [MessageLog(channel='email', recipient=f'r{i}@x', **body_fields(db, f"export body {i}"), status='sent')
+            for i in range(ROWS)]
+    db.add_all(logs)
+    db.commit()
+    first_id = logs[0].id
+    db.close()
+
+    monkeypatch.setattr(export, 'BATCH_SIZE', 10)
+    monkeypatch.setattr(bodies, '_cache', None)  # cold cache
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(get_engine(), 'before_cursor_execute', listener)
+    try:
+        rows = list(export.iter_message_logs(after_id=first_id - 1))
+    finally:
+        event.remove(get_engine(), 'before_cursor_execute', listener)
+
+    assert [row["message"] for row in rows] == [f"export body {i}" for i in range(ROWS)]
+    body_queries = [s for s in statements if 'message_bodies' in s]
+    assert len(body_queries) == ROWS // export.BATCH_SIZE
@@ -0,0 +1,27 @@
+import os
+
+from sqlalchemy import inspect, text
+
+from app import safe_init_db
+from app.models import Base, get_engine
+
+
+def test_upgrade_adds_columns_and_their_indexes(tmp_path):
+    engine = get_engine('sqlite:///' + os.path.join(tmp_path, 'old.db'))
+    # message_logs as created before message bodies, broadcasts and key ownership
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE message_logs (id INTEGER PRIMARY KEY, channel VARCHAR(20) NOT NULL, "
+            "recipient VARCHAR(200) NOT NULL, message TEXT NOT NULL, status VARCHAR(20), details TEXT, "
+            "retry_count INTEGER, created_at DATETIME)"
+        ))
+
+    safe_init_db(engine, Base)
+    safe_init_db(engine, Base)  # a second worker booting finds nothing left to do
+
+    inspector = inspect(engine)
+    columns = {c['name'] for c in inspector.get_columns('message_logs')}
+    assert {'body_hash', 'broadcast_id', 'api_key_id'} <= columns
+    indexes = {i['name'] for i in inspector.get_indexes('message_logs')}
+    expected = {i.name for i in Base.metadata.tables['message_logs'].indexes}
+    assert expected and expected <= indexes
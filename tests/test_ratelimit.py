@@ -0,0 +1,64 @@
+import os
+import threading
+import multiprocessing as mp
+
+from app.ratelimit import MemoryBackend, SQLiteBackend, SlidingWindowLimiter
+
+LIMIT = 20
+WINDOW = 86400
+WORKERS = 8
+HITS_PER_WORKER = 10
+
+
+def _worker(path, start, results):
+    limiter = SlidingWindowLimiter(SQLiteBackend(path))
+    start.wait()
+    allowed = sum(limiter.hit("key", [(LIMIT, WINDOW)])["allowed"] for _ in range(HITS_PER_WORKER))
+    results.put(allowed)
+
+
+def test_sqlite_limit_is_exact_across_processes(tmp_path):
+    # Separate processes stand in for gunicorn workers sharing one counter file
+    path = os.path.join(tmp_path, "ratelimit.db")
+    SQLiteBackend(path)
+    ctx = mp.get_context("fork")
+    start, results = ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(path, start, results)) for _ in range(WORKERS)]
+    for p in procs:
+        p.start()
+    start.set()
+    allowed = sum(results.get(timeout=30) for _ in procs)
+    for p in procs:
+        p.join()
+    assert allowed == LIMIT
+
+
+def test_memory_limit_is_exact_across_threads():
+    limiter = SlidingWindowLimiter(MemoryBackend())
+    start = threading.Barrier(WORKERS)
+    allowed = []
+
+    def worker():
+        start.wait()
+        allowed.append(sum(limiter.hit("key", [(LIMIT, WINDOW)])["allowed"] for _ in range(HITS_PER_WORKER)))
+
+    threads = [threading.Thread(target=worker) for _ in range(WORKERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(allowed) == LIMIT
+
+
+def test_rejected_requests_are_not_counted():
+    backend = MemoryBackend()
+    limiter = SlidingWindowLimiter(backend)
+    limits = [(LIMIT, WINDOW), (LIMIT * 10, WINDOW * 2)]
+    for _ in range(LIMIT):
+        assert limiter.hit("key", limits)["allowed"]
+    for _ in range(5):
+        status = limiter.hit("key", limits)
+        assert not status["allowed"] and status["remaining"] == 0
+    # Only the admitted requests count against the wider window
+    wide = [count for bucket, (count, _) in backend._counts.items() if f":{WINDOW * 2}:" in bucket]
+    assert sum(wide) == LIMIT
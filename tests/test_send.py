@@ -0,0 +1,86 @@
+import time
+import threading
+from concurrent.futures import Future
+from unittest import mock
+
+from app.models import get_session, MessageLog, RetryQueue
+
+SENT = {"status": "sent", "details": "ok"}
+TRANSIENT = {"status": "failed", "details": "timeout", "error_class": "network", "retryable": True}
+PERMANENT = {"status": "failed", "details": "no such mailbox", "error_class": "invalid_recipient", "retryable": False}
+
+
+def _resolved(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def test_list_send_with_retryable_failure(client, api_key):
+    results = {"good@x": SENT, "bad@x": PERMANENT, "tmp@x": TRANSIENT}
+    fake = lambda channel, recipients, message, priority: {r: _resolved(results[r]) for r in recipients}
+    with mock.patch('app.routes.dispatch_many', fake), mock.patch('app.routes.report_error') as report:
+        response = client.post('/send', json={"channel": "email", "recipient": list(results), "message": "list send"},
+                               headers={"X-API-Key": api_key})
+
+    assert response.status_code == 200, response.json
+    assert not report.called
+    body = response.json
+    assert [r["recipient"] for r in body["results"]] == list(results)
+    ids = [r["message_id"] for r in body["results"]]
+    assert all(ids)
+
+    db = get_session()
+    try:
+        assert {log.id for log in db.query(MessageLog).filter(MessageLog.id.in_(ids))} == set(ids)
+        queued = db.query(RetryQueue).filter(RetryQueue.message_log_id.in_(ids)).all()
+        assert [(item.recipient, item.message_log_id) for item in queued] == [("tmp@x", ids[2])]
+    finally:
+        db.close()
+
+
+def test_slow_channel_queues_for_retry_without_blocking_others(client, api_key):
+    from app import dispatcher
+    from app.dispatcher import PriorityDispatcher, bulkhead_settings
+
+    relay = threading.Event()
+    relayed = []
+
+    def guarded_send(channel, recipient, message):
+        if channel == 'email':
+            relayed.append(recipient)
+        return SENT
+
+    email = PriorityDispatcher(1, {1: 6, 2: 3, 3: 1}, {}, max_queued=100, name='test-email')
+    settings = lambda channel: dict(bulkhead_settings(channel), max_wait=0.2)
+    headers = {"X-API-Key": api_key}
+    try:
+        with mock.patch.dict(dispatcher._dispatchers, {'email': email}), \
+                mock.patch('app.dispatcher.bulkhead_settings', settings), \
+                mock.patch('app.breaker.guarded_send', guarded_send):
+            email.submit(2, relay.wait, 10)  # the relay is stuck on an earlier send
+
+            started = time.monotonic()
+            slow = client.post('/send', json={"channel": "email", "recipient": "a@x", "message": "slow relay"},
+                               headers=headers)
+            waited = time.monotonic() - started
+            fast = client.post('/send', json={"channel": "telegram", "recipient": "1", "message": "still flowing"},
+                               headers=headers)
+            relay.set()
+            email.submit(2, time.sleep, 0).result(timeout=5)  # drains the lane behind the stuck send
+    finally:
+        relay.set()
+
+    assert waited < 2
+    assert slow.status_code == 200
+    assert slow.json["error_class"] == "overloaded" and slow.json["retry_queued"]
+    assert fast.json["status"] == "sent"
+    # The withdrawn send never reaches the relay
+    assert relayed == []
+
+    db = get_session()
+    try:
+        item = db.query(RetryQueue).filter_by(message_log_id=slow.json["message_id"]).one()
+        assert (item.channel, item.recipient) == ("email", "a@x")
+    finally:
+        db.close()